@@ -0,0 +1,179 @@
+"""
+Measures terrain generation and meshing without opening a window.
+
+    python benchmark.py [--json] [size ...]
+
+For each size, a size x size block area of terrain is generated and the
+following are timed:
+
+- perlin: `Perlin.__call__` point by point against `Perlin.heights` over
+  the whole grid, and whether both agree exactly.
+- columns: `Terrain.generate` per sector column, as a heightfield and with
+  caves.
+- cull: `mesh.exposed_faces` over every section.
+- mesh: `mesh.build_section` over every section for the naive path (six
+  faces per block, as `Model.cuboid` drew them), the culled path and the
+  greedy path.
+
+Every time is the best of REPEAT runs. With --json the results are
+printed as one JSON document instead of a table.
+"""
+import json
+import math
+import sys
+import time
+
+import numpy
+
+import mesh
+import storage
+import terrain
+from mesh import SECTOR_SIZE
+
+SIZES = (32, 64, 128)
+SEED = 1
+# Every measurement is the best of this many runs.
+REPEAT = 3
+
+
+class Block:
+    def __init__(self, *files):
+        # Stand-ins for the atlas tiles and repeatable textures main.py loads.
+        self.tiles = tuple(('atlas', (0, 0, 1, 1)) for file in files)
+        self.textures = tuple((file, (0, 0, 1, 1)) for file in files)
+
+BLOCKS = storage.BlockRegistry()
+GRASS = BLOCKS.register(Block('grass_block_side', 'grass_block_top', 'dirt'))
+DIRT = BLOCKS.register(Block('dirt', 'dirt', 'dirt'))
+
+
+def colorize(y):
+    return (0, 255, 50+y)
+
+
+def timed(func, *args):
+    """ Returns (func(*args), the fewest seconds it took in REPEAT runs). """
+    best = math.inf
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        result = func(*args)
+        best = min(best, time.perf_counter() - start)
+    return result, best
+
+
+def columns(size):
+    """ Returns the sector columns covering a size x size area. """
+    n = math.ceil(size / SECTOR_SIZE)
+    return [(x, z) for x in range(n) for z in range(n)]
+
+
+def gen_world(size, seed=None, caves=False):
+    """ Returns the storage for the sector columns covering a size x size
+    area of terrain.
+    """
+    generator = terrain.Terrain(seed, surface=GRASS.id, fill=DIRT.id,
+                                caves=caves)
+    world = storage.ChunkStorage(BLOCKS)
+    for x, z in columns(size):
+        _, ids = generator.generate((x, z), SECTOR_SIZE)
+        world.set_box((x * SECTOR_SIZE, 0, z * SECTOR_SIZE), ids)
+    return world
+
+
+def snapshots(world):
+    """ Returns (origin, ids) for every section of `world`, with the one
+    block thick shell `mesh.build_section` needs.
+    """
+    result = []
+    for sector in world.sections:
+        low = [n * SECTOR_SIZE for n in sector]
+        ids = world.get_box([n - 1 for n in low],
+                            [n + SECTOR_SIZE + 1 for n in low])
+        result.append((low, ids))
+    return result
+
+
+def bench_perlin(size, seed):
+    perlin = terrain.Perlin(seed)
+    scalar, scalar_seconds = timed(
+        lambda: [[perlin(x, z) for z in range(size)] for x in range(size)])
+    xs = numpy.arange(size)[:, None]
+    zs = numpy.arange(size)[None, :]
+    batch, batch_seconds = timed(perlin.heights, xs, zs)
+    return {
+        'points': size * size,
+        'scalar_seconds': scalar_seconds,
+        'batch_seconds': batch_seconds,
+        'speedup': scalar_seconds / batch_seconds,
+        'identical': bool((numpy.array(scalar) == batch).all()),
+    }
+
+
+def bench_columns(size, seed):
+    result = {'columns': len(columns(size))}
+    for name, caves in (('heightfield', False), ('caves', True)):
+        generator = terrain.Terrain(seed, caves=caves)
+        _, seconds = timed(
+            lambda: [generator.generate(column) for column in columns(size)])
+        result[name + '_seconds'] = seconds
+        result[name + '_ms_per_column'] = seconds * 1000 / result['columns']
+    return result
+
+
+def bench_cull(sections):
+    faces, seconds = timed(
+        lambda: [mesh.exposed_faces(ids) for _, ids in sections])
+    return {
+        'sections': len(sections),
+        'faces': sum(len(p) for f in faces for p, _ in f.values()),
+        'seconds': seconds,
+    }
+
+
+def bench_mesh(sections):
+    result = {}
+    for name, greedy, cull in (('naive', False, False),
+                               ('culled', False, True),
+                               ('greedy', True, True)):
+        arrays, seconds = timed(
+            lambda: [mesh.build_section(ids, low, BLOCKS, colorize, greedy,
+                                        cull) for low, ids in sections])
+        result[name + '_quads'] = sum(len(vertices) // 12 for section in arrays
+                                      for vertices, _, _ in section.values())
+        result[name + '_seconds'] = seconds
+    return result
+
+
+def run(sizes=SIZES, seed=SEED):
+    """ Runs every benchmark at every size. Returns a list of results, one
+    dict per benchmark and size.
+    """
+    results = []
+    for size in sizes:
+        sections = snapshots(gen_world(size, seed))
+        for name, result in (('perlin', bench_perlin(size, seed)),
+                             ('columns', bench_columns(size, seed)),
+                             ('cull', bench_cull(sections)),
+                             ('mesh', bench_mesh(sections))):
+            results.append(dict(benchmark=name, size=size, **result))
+    return results
+
+
+def main(*args):
+    as_json = '--json' in args
+    sizes = [int(arg) for arg in args if arg != '--json'] or SIZES
+    results = run(sizes)
+    if as_json:
+        print(json.dumps({'seed': SEED, 'results': results}, indent=2))
+        return
+    for result in results:
+        fields = ['%s=%s' % (key, '%.4g' % value if isinstance(value, float)
+                             else value)
+                  for key, value in result.items()
+                  if key not in ('benchmark', 'size')]
+        print('%-8s %5d  %s' % (result['benchmark'], result['size'],
+                                ' '.join(fields)))
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
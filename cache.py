@@ -0,0 +1,108 @@
+"""
+A least-recently-used cache of generated sector columns, so that walking
+back over an area, or regenerating a column after it was unloaded, does not
+evaluate the terrain noise again.
+"""
+import os
+from collections import OrderedDict
+
+import numpy
+
+
+class ChunkCache:
+    """ Keeps the (heights, ids) arrays of generated sector columns, as
+    returned by `Terrain.generate`, keyed by (seed, column). One cache must
+    only be used with terrains that share their other settings.
+
+    Once the arrays take more than `max_bytes`, the least recently used
+    columns are evicted. With a `directory`, evicted columns are written
+    there as compressed .npz files first and read back on the next miss.
+    The files only hold this cache's overflow: each one is deleted when it
+    is read back, and any .npz files already in the directory are deleted
+    when the cache is created and by `close`.
+    """
+    def __init__(self, max_bytes=64 << 20, directory=None):
+        self.max_bytes = max_bytes
+        self.directory = directory
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            for name in os.listdir(directory):
+                if name.endswith('.npz'):
+                    os.remove(os.path.join(directory, name))
+        self.entries = OrderedDict()
+        self.nbytes = 0
+        # Keys of the columns written to the directory.
+        self.spilled = set()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries or key in self.spilled
+
+    def path(self, key):
+        seed, (x, z) = key
+        return os.path.join(self.directory, '%s_%d_%d.npz' % (seed, x, z))
+
+    def get(self, key):
+        """ Returns the (heights, ids) stored for `key`, or None. The arrays
+        are shared with the cache and must not be modified.
+        """
+        value = self.entries.get(key)
+        if value is not None:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return value
+        if key in self.spilled:
+            with numpy.load(self.path(key)) as data:
+                value = data['heights'], data['ids']
+            os.remove(self.path(key))
+            self.spilled.discard(key)
+            self.disk_hits += 1
+            self.put(key, *value)
+            return value
+        self.misses += 1
+        return None
+
+    def put(self, key, heights, ids):
+        """ Stores the arrays generated for `key`, evicting the least
+        recently used columns beyond the memory cap.
+        """
+        old = self.entries.pop(key, None)
+        if old is not None:
+            self.nbytes -= sum(array.nbytes for array in old)
+        self.entries[key] = heights, ids
+        self.nbytes += heights.nbytes + ids.nbytes
+        while self.nbytes > self.max_bytes and len(self.entries) > 1:
+            self.evict()
+
+    def evict(self):
+        """ Drops the least recently used column, spilling it to disk first
+        if there is a directory.
+        """
+        key, (heights, ids) = self.entries.popitem(last=False)
+        self.nbytes -= heights.nbytes + ids.nbytes
+        if self.directory and key not in self.spilled:
+            numpy.savez_compressed(self.path(key), heights=heights, ids=ids)
+            self.spilled.add(key)
+
+    def close(self):
+        """ Deletes the files of the columns spilled to disk. """
+        for key in self.spilled:
+            os.remove(self.path(key))
+        self.spilled.clear()
+
+    def metrics(self):
+        """ Returns the size and hit counts of the cache. """
+        return {
+            'columns': len(self.entries),
+            'bytes': self.nbytes,
+            'max_bytes': self.max_bytes,
+            'spilled': len(self.spilled),
+            'hits': self.hits,
+            'disk_hits': self.disk_hits,
+            'misses': self.misses,
+        }
@@ -0,0 +1,42 @@
+"""
+Generates terrain without opening a window and writes it to a zip archive.
+
+    python export.py path [radius] [seed]
+
+Sector columns are streamed from `terrain.stream` in spiral order out to
+`radius` rings around the origin and written as they are generated, so only
+one column is held in memory at a time. Each column is stored as
+`x_z/heights.npy` and `x_z/ids.npy`, as returned by `Terrain.generate`.
+"""
+import sys
+import zipfile
+
+import numpy
+
+import terrain
+from mesh import SECTOR_SIZE
+
+
+def export(path, generator, center=(0, 0), radius=8):
+    """ Writes the sector columns of the terrain `generator` to the zip
+    archive at `path`. Returns the number of columns written.
+    """
+    count = 0
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for (x, z), heights, ids in terrain.stream(generator, center, radius,
+                                                   SECTOR_SIZE):
+            for name, array in (('heights', heights), ('ids', ids)):
+                with archive.open('%d_%d/%s.npy' % (x, z, name), 'w') as f:
+                    numpy.save(f, array)
+            count += 1
+    return count
+
+
+def main(path, radius=8, seed=None):
+    generator = terrain.Terrain(seed)
+    count = export(path, generator, radius=radius)
+    print('%d columns of seed %s written to %s' % (count, generator.seed, path))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1], *[int(arg) for arg in sys.argv[2:]])
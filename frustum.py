@@ -0,0 +1,67 @@
+"""
+View-frustum tests for the camera `Window.set3d` and `Window.push` set up.
+"""
+import math
+
+
+def perspective(fovy, aspect, near, far):
+    """ The matrix gluPerspective multiplies onto the projection matrix. """
+    f = 1 / math.tan(math.radians(fovy) / 2)
+    return [[f / aspect, 0, 0, 0],
+            [0, f, 0, 0],
+            [0, 0, (far + near) / (near - far), 2 * far * near / (near - far)],
+            [0, 0, -1, 0]]
+
+
+def rotation_x(angle):
+    """ The matrix glRotatef(angle, 1, 0, 0) multiplies onto the stack. """
+    c, s = math.cos(math.radians(angle)), math.sin(math.radians(angle))
+    return [[1, 0, 0, 0], [0, c, -s, 0], [0, s, c, 0], [0, 0, 0, 1]]
+
+
+def rotation_y(angle):
+    """ The matrix glRotatef(angle, 0, 1, 0) multiplies onto the stack. """
+    c, s = math.cos(math.radians(angle)), math.sin(math.radians(angle))
+    return [[c, 0, s, 0], [0, 1, 0, 0], [-s, 0, c, 0], [0, 0, 0, 1]]
+
+
+def translation(x, y, z):
+    """ The matrix glTranslatef(x, y, z) multiplies onto the stack. """
+    return [[1, 0, 0, x], [0, 1, 0, y], [0, 0, 1, z], [0, 0, 0, 1]]
+
+
+def multiply(a, b):
+    return [[sum(a[i][k] * b[k][j] for k in range(4)) for j in range(4)]
+            for i in range(4)]
+
+
+class Frustum:
+    """ The six clipping planes of a perspective camera, in world
+    coordinates. Each plane is an (a, b, c, d) tuple with its normal facing
+    into the frustum, so a point is inside when a*x + b*y + c*z + d >= 0 for
+    every plane.
+    """
+    def __init__(self, pos, rot, fovy, aspect, near, far):
+        clip = perspective(fovy, aspect, near, far)
+        for matrix in (rotation_x(-rot[0]), rotation_y(-rot[1]),
+                       translation(-pos[0], -pos[1], -pos[2])):
+            clip = multiply(clip, matrix)
+        w = clip[3]
+        self.planes = []
+        for row in clip[:3]:
+            self.planes.append(tuple(w[i] + row[i] for i in range(4)))
+            self.planes.append(tuple(w[i] - row[i] for i in range(4)))
+
+    def intersects_box(self, low, high):
+        """ Returns whether any part of the axis-aligned box from `low` to
+        `high` may be inside the frustum. Boxes near a corner of the frustum
+        can be reported visible when they are not, but never the reverse.
+        """
+        x1, y1, z1 = low
+        x2, y2, z2 = high
+        for a, b, c, d in self.planes:
+            # Test the corner furthest along the plane normal.
+            if (a * (x2 if a > 0 else x1) + b * (y2 if b > 0 else y1) +
+                    c * (z2 if c > 0 else z1) + d) < 0:
+                return False
+        return True
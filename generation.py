@@ -0,0 +1,46 @@
+"""
+Generates terrain in worker processes, off the render thread.
+
+Every worker unpickles its own copy of the `terrain.Terrain` once, when it
+starts, and from then on only sector column coordinates go out and compact
+uint16 arrays come back. A column's blocks depend only on the terrain's
+settings and the column, so the output is the same whatever the number of
+workers or the order jobs finish in.
+"""
+from concurrent.futures import ProcessPoolExecutor
+
+from mesh import SECTOR_SIZE
+
+# The terrain of this worker process.
+_terrain = None
+
+
+def _start(terrain):
+    global _terrain
+    _terrain = terrain
+
+
+def _generate(column):
+    return _terrain.generate(column, SECTOR_SIZE)
+
+
+class TerrainPool:
+    """ Generates sector columns of `terrain` across `workers` processes
+    (one per core by default).
+    """
+    def __init__(self, terrain, workers=None):
+        self.terrain = terrain
+        self.executor = ProcessPoolExecutor(
+            workers, initializer=_start, initargs=(terrain,))
+
+    def submit(self, column):
+        """ Returns a future for (heights, ids) of `column`, as from
+        `Terrain.generate`.
+        """
+        return self.executor.submit(_generate, column)
+
+    def shutdown(self, wait=True):
+        """ Stops the workers once the jobs already started are done. Jobs
+        that have not started must be cancelled through their futures.
+        """
+        self.executor.shutdown(wait)
@@ -1,35 +1,22 @@
+import pyglet
 from pyglet.gl import *
 from pyglet.window import key
 import math
+import os
+import time
+import numpy
 import terrain
+import cache
+import generation
+import mesh
+import physics
+import scheduler
+import storage
+from frustum import Frustum
+from mesh import SECTOR_SIZE, normalize, sectorize
+from raycast import raycast
 from collections import defaultdict, deque
-
-xrange = range
-FACES = [
-    ( 0, 1, 0),
-    ( 0,-1, 0),
-    (-1, 0, 0),
-    ( 1, 0, 0),
-    ( 0, 0, 1),
-    ( 0, 0,-1),
-    (1, 0, 1),
-    (-1, 0, -1)
-]
-
-def normalize(position):
-    """ Accepts `position` of arbitrary precision and returns the block
-    containing that position.
-    Parameters
-    ----------
-    position : tuple of len 3
-    Returns
-    -------
-    block_position : tuple of ints of len 3
-    """
-    x, y, z = position
-    x, y, z = (int(round(x)), int(round(y)), int(round(z)))
-    return (x, y, z)
-
+from concurrent.futures import ThreadPoolExecutor
 
 class Colorizer:
     def colorize(self):
@@ -38,23 +25,17 @@ class Colorizer:
 class GrassColorizer(Colorizer):
     def colorize(self, y):
         # Colorize block based on y level.
-        color = (0, 255, 50+y)
-        return ('c3B', color*4)
+        return (0, 255, 50+y)
 
 
 class Block(object):
-    tex = []
+    # Texture files, given as (side, top, bottom).
     files = []
-
-    def get_tex(self,file):
-        tex = pyglet.image.load(file).get_texture()
-        glTexParameterf(GL_TEXTURE_2D,GL_TEXTURE_MIN_FILTER,GL_NEAREST)
-        glTexParameterf(GL_TEXTURE_2D,GL_TEXTURE_MAG_FILTER,GL_NEAREST)
-        return pyglet.graphics.TextureGroup(tex)
-
-    def __init__(self):
-        for nme in self.files:
-            self.tex.append(self.get_tex(nme))
+    # Filled in by `load_textures`: a (group, uv rectangle) pair per file,
+    # first for the shared atlas and then for a texture of its own that
+    # greedy meshing can repeat across merged faces.
+    tiles = ()
+    textures = ()
 
 class GrassBlock(Block):
     files = ['grass_block_side.png','grass_block_top.png','dirt.png']
@@ -62,110 +43,305 @@ class GrassBlock(Block):
 class DirtBlock(Block):
     files = ['dirt.png', 'dirt.png', 'dirt.png']
 
-GRASS = GrassBlock()
-DIRT = DirtBlock()
+def load_textures(registry, size=256):
+    """ Packs the textures of every registered block into one atlas, so the
+    whole world draws with a single texture bind however many block types
+    there are. Each file is loaded once, and also gets a GL_REPEAT texture
+    of its own because a merged greedy quad cannot repeat an atlas tile.
+    """
+    atlas = pyglet.image.atlas.TextureAtlas(size, size)
+    tiles, textures = {}, {}
+    for block in registry.blocks[1:]:
+        for file in block.files:
+            if file in tiles:
+                continue
+            image = pyglet.image.load(file)
+            u0, v0, _, _, _, _, u1, v1, _, _, _, _ = atlas.add(image).tex_coords
+            tiles[file] = (u0, v0, u1, v1)
+            texture = image.get_texture()
+            glTexParameteri(GL_TEXTURE_2D,GL_TEXTURE_MIN_FILTER,GL_NEAREST)
+            glTexParameteri(GL_TEXTURE_2D,GL_TEXTURE_MAG_FILTER,GL_NEAREST)
+            glTexParameteri(GL_TEXTURE_2D,GL_TEXTURE_WRAP_S,GL_REPEAT)
+            glTexParameteri(GL_TEXTURE_2D,GL_TEXTURE_WRAP_T,GL_REPEAT)
+            textures[file] = pyglet.graphics.TextureGroup(texture)
+    glBindTexture(atlas.texture.target, atlas.texture.id)
+    glTexParameteri(GL_TEXTURE_2D,GL_TEXTURE_MIN_FILTER,GL_NEAREST)
+    glTexParameteri(GL_TEXTURE_2D,GL_TEXTURE_MAG_FILTER,GL_NEAREST)
+    group = pyglet.graphics.TextureGroup(atlas.texture)
+    for block in registry.blocks[1:]:
+        block.tiles = tuple((group, tiles[file]) for file in block.files)
+        block.textures = tuple((textures[file], (0, 0, 1, 1))
+                               for file in block.files)
+
+BLOCKS = storage.BlockRegistry()
+GRASS = BLOCKS.register(GrassBlock())
+DIRT = BLOCKS.register(DirtBlock())
+load_textures(BLOCKS)
 
 class Model:
-    queue = deque()
-    sectorqueue = deque()
-    def __init__(self, player):
+    def __init__(self, player, greedy=False, radius=4, budget=4, workers=0,
+                 caves=False, cache_bytes=64 << 20, cache_dir=None):
         self.batch = pyglet.graphics.Batch()
-        self.world = defaultdict(lambda: None)
-        self.shown = {}
+        self.world = storage.ChunkStorage(BLOCKS)
+        # Positions of blocks that are in the world but not drawn.
+        self.hidden = set()
+        # Mapping from section to a mapping of texture group to the vertex
+        # list drawing that part of it.
         self._shown = {}
+        # Sections that changed since their vertex lists were built.
+        self.dirty = set()
+        # Sections are meshed off the main thread. Each finished build is
+        # appended to `built` as a (sector, future) pair by the worker that
+        # ran it, and only the batch upload happens in `update`.
+        self.builder = ThreadPoolExecutor(max_workers=os.cpu_count())
+        self.building = set()
+        self.built = deque()
+        # Whether sections are built with greedy meshing.
+        self.greedy = greedy
+        # Sector columns, as (x, z), within `radius` sections of the player
+        # are generated and shown. The ones that fall out of range are
+        # unloaded.
+        self.radius = radius
+        self.loaded = set()
+        self.center = None
         self.player = player
-        self.perlin = terrain.Perlin()
-        self.gen_terrain()
+        self.terrain = terrain.Terrain(surface=GRASS.id, fill=DIRT.id,
+                                       caves=caves)
+        # With `workers`, sector columns are generated in that many worker
+        # processes. `generating` maps each column to the future of its job,
+        # so the job can be cancelled if the column goes out of range. Each
+        # finished job is appended to `generated` as a (column, future) pair
+        # and placed in the world in `update`.
+        self.pool = workers and generation.TerrainPool(self.terrain, workers)
+        self.generating = {}
+        self.generated = deque()
+        # Generated columns, kept so that revisiting them is nearly free.
+        self.cache = cache.ChunkCache(cache_bytes, cache_dir)
         self.grasscolorizer = GrassColorizer()
+        # Work for `update`, run within `budget` milliseconds per frame and
+        # nearest to the player first.
+        self.queue = scheduler.Scheduler(budget)
 
-    def inqueue(self, func, *args):
-        self.queue.append([func, args])
-
-    def outqueue(self):
-        return self.queue.popleft()
-    
-    def insectorqueue(self, func, *args):
-        self.sectorqueue.append([func, args])
-
-    def outsectorqueue(self):
-        return self.sectorqueue.popleft()
+    def idle(self):
+        """ Returns whether every sector in range has been generated, built
+        and uploaded.
+        """
+        return self.center is not None and not (
+            self.queue or self.generating or self.generated or
+            self.dirty or self.building or self.built)
+
+    def inqueue(self, kind, position, func, *args, tag=None):
+        """ Queues `func(*args)` as a job of `kind` (see scheduler.KINDS)
+        concerning the block at `position`. Jobs with a `tag` can be
+        cancelled together.
+        """
+        self.queue.push(kind, position, func, *args, tag=tag)
 
-    def gen_terrain(self):
-        for x in range(100):
-            for z in range(100):
-                self.gen_block(x, z)
+    def change_sectors(self):
+        """ Loads the sector columns that came within `radius` of the player
+        and queues unloading of the ones that left it. Queued work for a
+        column is cancelled as soon as it changes sides, and the queue is
+        reordered around the player's new position.
+        """
+        position = normalize(self.player.pos)
+        x, _, z = sectorize(position)
+        if (x, z) == self.center:
+            return
+        self.center = (x, z)
+        self.queue.reprioritize(position)
+        r = self.radius
+        # Nearest first, so that columns are queued in the order they are
+        # needed. Only the order comes from the spiral: the columns are not
+        # pulled from `terrain.stream`, which yields each column once, while
+        # a column unloaded here has to be generated again when it comes
+        # back into range.
+        wanted = [(cx, cz) for cx, cz in terrain.spiral((x, z), r)
+                  if (cx - x) ** 2 + (cz - z) ** 2 <= r * r]
+        for column in self.loaded - set(wanted):
+            self.loaded.discard(column)
+            self.queue.cancel(column)
+            # A job already sent to the workers is dropped too, unless it
+            # has started, so it does not hold up the columns still wanted.
+            future = self.generating.get(column)
+            if future is not None and future.cancel():
+                del self.generating[column]
+            center = ((column[0] + 0.5) * SECTOR_SIZE, 0,
+                      (column[1] + 0.5) * SECTOR_SIZE)
+            self.inqueue('hide', center, self.unload_sector, column,
+                         tag=column)
+        for column in wanted:
+            if column not in self.loaded:
+                self.queue.cancel(column)
+                self.load_sector(column)
+
+    def load_sector(self, column):
+        """ Queues generation of the sector column. """
+        self.loaded.add(column)
+        center = ((column[0] + 0.5) * SECTOR_SIZE, 0,
+                  (column[1] + 0.5) * SECTOR_SIZE)
+        self.inqueue('generate', center, self._gen_column, column,
+                     tag=column)
+
+    def unload_sector(self, column):
+        """ Removes every block of the sector column from the world and
+        frees the vertex lists of its sections. Sections of neighbouring
+        columns are rebuilt, as their border faces are now exposed.
+        """
+        self.loaded.discard(column)
+        x, z = column
+        for sector in list(self.world.sections):
+            if (sector[0], sector[2]) == column:
+                self.world.unload(sector)
+        for sector in list(self._shown):
+            if (sector[0], sector[2]) == column:
+                self.dirty.discard(sector)
+                for vlist in self._shown.pop(sector).values():
+                    vlist.delete()
+        if self.hidden:
+            self.hidden = {position for position in self.hidden
+                           if sectorize(position)[::2] != column}
+        neighbors = {(x - 1, z), (x + 1, z), (x, z - 1), (x, z + 1)}
+        for sector in self.world.sections:
+            if (sector[0], sector[2]) in neighbors:
+                self.dirty.add(sector)
 
 
     def _hide_all(self):
         '''
         Debug function to hide all
         '''
-        for pos in self._shown.keys():
-            self.hide_block(pos)
-
-    def _gen_block(self, x, z):
-        y = self.perlin(abs(x), abs(z))
-        for yy in range(0, y):
-            self.add_block((x, yy, z), DIRT)
-        self.add_block((x, y, z), GRASS)
+        for sector, blocks in self.world.sections.items():
+            origin = numpy.array(sector) * SECTOR_SIZE
+            for position in (numpy.argwhere(blocks) + origin).tolist():
+                self.hide_block(tuple(position))
+
+    def _gen_column(self, column):
+        """ Generates the whole sector column from one heightmap, or hands
+        it to the worker processes. Cached columns are placed right away.
+        """
+        key = (self.terrain.seed, column)
+        arrays = self.cache.get(key)
+        if arrays is None and not self.pool:
+            arrays = self.terrain.generate(column)
+            self.cache.put(key, *arrays)
+        if arrays is not None:
+            self.place_column(column, *arrays)
+            return
+        future = self.pool.submit(column)
+        self.generating[column] = future
+        future.add_done_callback(
+            lambda future: self.generated.append((column, future)))
+
+    def top(self, x, z):
+        """ Returns the y of the highest solid block at (x, z), or -1 if
+        there is none. Its sector column is generated and cached if it was
+        not already.
+        """
+        column = (x // SECTOR_SIZE, z // SECTOR_SIZE)
+        key = (self.terrain.seed, column)
+        arrays = self.cache.get(key)
+        if arrays is None:
+            arrays = self.terrain.generate(column)
+            self.cache.put(key, *arrays)
+        solid = arrays[1][x % SECTOR_SIZE, :, z % SECTOR_SIZE].nonzero()[0]
+        return int(solid.max()) if len(solid) else -1
+
+    def place_column(self, column, heights, ids):
+        """ Writes a generated sector column into the world. """
+        x0, z0 = column[0] * SECTOR_SIZE, column[1] * SECTOR_SIZE
+        self.world.set_box((x0, 0, z0), ids)
+        self.mark_dirty((x0, 0, z0), (x0 + SECTOR_SIZE, ids.shape[1],
+                                      z0 + SECTOR_SIZE))
 
-    def gen_block(self,x, z, immediate=False):
+    def add_block(self,position, block, immediate=True):
+        self.world[position] = block
         if immediate:
-            self._gen_block(x, z)
+            self.check_neighbors(position)
         else:
-            self.inqueue(self._gen_block, x, z)
+            self.inqueue('show', position, self.check_neighbors, position)
 
+    def _remove_block(self, position):
+        del self.world[position]
+        self.hidden.discard(position)
+        self.check_neighbors(position)
 
-    def add_block(self,position, block, immediate=True):
-        self.world[position] = block
+    def remove_block(self, position, immediate=True):
         if immediate:
-            self.show_block(position)
+            self._remove_block(position)
         else:
-            self.inqueue(self.show_block, position)
+            self.inqueue('hide', position, self._remove_block, position)
+
+    def check_neighbors(self, position):
+        """ Marks the sections whose visible faces may have changed with
+        the block at `position` for rebuilding.
+        """
+        x, y, z = position
+        self.mark_dirty(position, (x + 1, y + 1, z + 1))
+
+    def mark_dirty(self, low, high):
+        """ Marks for rebuilding every section holding a block from `low`
+        (inclusive) to `high` (exclusive), or touching one of them.
+        """
+        first = sectorize([n - 1 for n in low])
+        last = sectorize(high)
+        for x in range(first[0], last[0] + 1):
+            for y in range(first[1], last[1] + 1):
+                for z in range(first[2], last[2] + 1):
+                    self.dirty.add((x, y, z))
 
     def _hide_block(self,position):
-        del self.shown[position]   # delete block reference
-        for vlist in self._shown[position]:
-            vlist.delete()
-        del self._shown[position]  # delete vertex list
+        self.hidden.add(position)
+        self.dirty.add(sectorize(position))
 
     def hide_block(self, position, immediate=False):
         if immediate:
             self._hide_block(position)
         else:
-            self.inqueue(self._hide_block, position)
+            self.inqueue('hide', position, self._hide_block, position)
 
     def show_block(self,position):
-        self.shown[position] = self.world[position]
-        self.cuboid(*position, self.world[position])
+        self.hidden.discard(position)
+        self.dirty.add(sectorize(position))
 
-    def cuboid(self, x, y, z, block):
+    def build_section(self, sector):
         '''
-        Draws a cuboid from x1,y1,z1 to x2,y2,z2 and covers each side with tex
-        tex format:
-            (side, top, bottom)
-        Facing in the -z direction
+        Starts meshing `sector` on a worker thread from a snapshot of its
+        block ids and the blocks bordering it.
         '''
-        tex = block.tex
-        front = tex[0]
-        back = tex[0]
-        left = tex[0]
-        right = tex[0]
-        top = tex[1]
-        bottom = tex[2]
-
-        tex_coords = ("t2f", (0, 0, 1, 0, 1, 1, 0, 1))
-        x1, y1, z1 = x, y, z
-        x2, y2, z2 = x + 1, y + 1, z + 1
-        color = self.grasscolorizer.colorize(y)
-
-        cube = (self.batch.add(4, GL_QUADS, right, ('v3f', (x1, y1, z1, x1, y1, z2, x1, y2, z2, x1, y2, z1)), tex_coords),
-        self.batch.add(4, GL_QUADS, left, ('v3f', (x2, y1, z2, x2, y1, z1, x2, y2, z1, x2, y2, z2)), tex_coords),
-        self.batch.add(4, GL_QUADS, bottom, ('v3f', (x1, y1, z1, x2, y1, z1, x2, y1, z2, x1, y1, z2)), tex_coords),
-        self.batch.add(4, GL_QUADS, top, ('v3f', (x1, y2, z2, x2, y2, z2, x2, y2, z1, x1, y2, z1)), tex_coords, color),
-        self.batch.add(4, GL_QUADS, back, ('v3f', (x2, y1, z1, x1, y1, z1, x1, y2, z1, x2, y2, z1)), tex_coords),
-        self.batch.add(4, GL_QUADS, front, ('v3f', (x1, y1, z2, x2, y1, z2, x2, y2, z2, x1, y2, z2)), tex_coords))
-        self._shown[(x, y, z)] = cube
+        if sector not in self.world.sections:
+            self.upload_section(sector, {})
+            return
+        self.building.add(sector)
+        low = [n * SECTOR_SIZE for n in sector]
+        ids = self.world.get_box([n - 1 for n in low],
+                                 [n + SECTOR_SIZE + 1 for n in low])
+        hidden = None
+        if self.hidden:
+            hidden = numpy.zeros((SECTOR_SIZE,) * 3, bool)
+            for position in self.hidden:
+                if sectorize(position) == sector:
+                    hidden[tuple(p - n for p, n in zip(position, low))] = True
+        future = self.builder.submit(mesh.build_section, ids, low, BLOCKS,
+                                     self.grasscolorizer.colorize,
+                                     self.greedy, True, hidden)
+        future.add_done_callback(
+            lambda future: self.built.append((sector, future)))
+
+    def upload_section(self, sector, arrays):
+        '''
+        Replaces the vertex lists of `sector` with one vertex list per
+        texture group from the built `arrays`.
+        '''
+        for vlist in self._shown.pop(sector, {}).values():
+            vlist.delete()
+        if not arrays:
+            return
+        self._shown[sector] = {
+            group: self.batch.add(len(vertices) // 3, GL_QUADS, group,
+                                  ('v3f/static', vertices),
+                                  ('t2f/static', tex_coords),
+                                  ('c3B/static', colors))
+            for group, (vertices, tex_coords, colors) in arrays.items()}
 
     def get_sight_vector(self):
         """ Returns the current line of sight vector indicating the direction
@@ -196,26 +372,68 @@ class Model:
         max_distance : int
             How many blocks away to search for a hit.
         """
-        m = 8
-        x, y, z = position
-        dx, dy, dz = vector
-        previous = None
-        for _ in xrange(max_distance * m):
-            key = normalize((x, y, z))
-            if key != previous and key in self.world:
-                return key, previous
-            previous = key
-            x, y, z = x + dx / m, y + dy / m, z + dz / m
-        return None, None
+        block, previous, _ = raycast(self.world, position, vector,
+                                     max_distance)
+        return block, previous
 
     def update(self):
-        for i in range(5):
-            if len(self.queue) != 0:
-                func, args = self.outqueue()
-                func(*args)
-
-    def draw(self):
-        self.batch.draw()
+        self.change_sectors()
+        self.queue.run()
+        while self.generated:
+            column, future = self.generated.popleft()
+            if self.generating.get(column) is future:
+                del self.generating[column]
+            if future.cancelled():
+                continue
+            arrays = future.result()
+            self.cache.put((self.terrain.seed, column), *arrays)
+            # Columns unloaded while they were generated are dropped.
+            if column in self.loaded:
+                self.place_column(column, *arrays)
+        while self.built:
+            sector, future = self.built.popleft()
+            self.building.discard(sector)
+            arrays = future.result()
+            if sector not in self.world.sections:
+                # Unloaded while it was being built.
+                arrays = {}
+            self.upload_section(sector, arrays)
+        # A section that is still being built stays dirty, and is built
+        # again from a fresh snapshot once its current build is uploaded.
+        for sector in self.dirty - self.building:
+            self.dirty.discard(sector)
+            self.build_section(sector)
+
+    def close(self):
+        """ Cancels the terrain jobs that have not started, stops the worker
+        processes and deletes the columns the cache spilled to disk.
+        """
+        for future in self.generating.values():
+            future.cancel()
+        if self.pool:
+            self.pool.shutdown()
+        self.cache.close()
+
+    def draw(self, frustum=None):
+        """ Draws every section whose bounding box intersects `frustum`, one
+        texture group at a time. Without a frustum the whole batch is drawn.
+        """
+        if frustum is None:
+            self.batch.draw()
+            return
+        visible = defaultdict(list)
+        for (x, y, z), vlists in self._shown.items():
+            low = (x * SECTOR_SIZE, y * SECTOR_SIZE, z * SECTOR_SIZE)
+            high = (low[0] + SECTOR_SIZE, low[1] + SECTOR_SIZE,
+                    low[2] + SECTOR_SIZE)
+            if frustum.intersects_box(low, high):
+                for group, vlist in vlists.items():
+                    visible[group].append(vlist)
+        for group, vlists in visible.items():
+            group.set_state_recursive()
+            for vlist in vlists:
+                vlist.draw(GL_QUADS)
+            group.unset_state_recursive()
 
 
 
@@ -249,24 +467,41 @@ class Window(pyglet.window.Window):
     def Projection(self): glMatrixMode(GL_PROJECTION); glLoadIdentity()
     def Model(self): glMatrixMode(GL_MODELVIEW); glLoadIdentity()
     def set2d(self): self.Projection(); gluOrtho2D(0,self.width,0,self.height); self.Model()
-    def set3d(self): self.Projection(); gluPerspective(70,self.width/self.height,0.05,1000); self.Model()
+    def set3d(self): self.Projection(); gluPerspective(self.fov,self.width/self.height,self.near,self.far); self.Model()
+    def frustum(self): return Frustum(self.player.pos,self.player.rot,self.fov,self.width/self.height,self.near,self.far)
+    fov = 70; near = 0.05; far = 1000
 
     def setLock(self,state): self.lock = state; self.set_exclusive_mouse(state)
     lock = False
+    mainmenu = False
+    # Time not yet simulated by a physics step.
+    ticks = 0
     mouse_lock = property(lambda self: self.lock, setLock)
 
     def __init__(self,*args, **kwargs):
+        self.started = time.perf_counter()
+        # Seconds from startup to each milestone, once it is reached.
+        self.startup = {}
         super().__init__(*args, **kwargs)
         self.set_minimum_size(300, 200)
         self.keys = key.KeyStateHandler()
         self.push_handlers(self.keys)
-        pyglet.clock.schedule(self.update)
 
         self.player = Player((-1, -1, -1), (-30, 0))
-        self.model = Model(self.player)
-        import time
-        time.sleep(5)
-        
+        self.model = Model(self.player, workers=os.cpu_count())
+        # Start standing on the highest block under the player's box rather
+        # than inside the ground.
+        top = max(self.model.top(x, z)
+                  for x, z in physics.footprint(self.player.pos))
+        self.player.pos[1] = top + 1 - physics.PLAYER_BOX[0][1]
+        # Terrain streams in nearest first from the first update on.
+        pyglet.clock.schedule(self.update)
+
+    def milestone(self, name):
+        """ Records and reports how long after startup `name` happened. """
+        if name not in self.startup:
+            self.startup[name] = time.perf_counter() - self.started
+            print('%s after %.3fs' % (name, self.startup[name]))
 
     def on_mouse_motion(self, x, y, dx, dy):
         if self.mouse_lock:
@@ -274,54 +509,48 @@ class Window(pyglet.window.Window):
 
     def on_key_press(self, KEY, MOD):
         if KEY == key.Q: self.mouse_lock = not self.mouse_lock
-        if KEY == key.M: self.model.hide_block((0, 0, 0))
+        if KEY == key.M: self.model.remove_block((0, 0, 0))
     
     def update(self, dt):
-        self.player.update(dt,self.keys)
         self.model.update()
-        self.player.pos = self.collide(self.player.pos)
-    
-    def collide(self, position, height=2): 
-        # How much overlap with a dimension of a surrounding block you need to
-        # have to count as a collision. If 0, touching terrain at all counts as
-        # a collision. If .49, you sink into the ground, as if walking through
-        # tall grass. If >= .5, you'll fall through the ground.
-        pad = 0.25
-        p = list(position)
-        np = normalize(position)
-        for face in FACES:  # check all surrounding blocks
-            for i in range(3):  # check each dimension independently
-                # How much overlap you have with this dimension.
-                d = (p[i] - np[i]) * face[i]
-                if d < pad:
-                    continue
-                for dy in range(height):  # check each height
-                    op = list(np)
-                    op[1] -= dy
-                    op[i] += face[i]
-                    if tuple(op) not in self.model.world:
-                        continue
-                    p[i] -= (d - pad) * face[i]
-                    if face == (0, -1, 0):
-                        # You are colliding with the ground or ceiling, so stop
-                        # falling / rising.
-                        self.dy = 0
-                    if face == (0, 1, 0):
-                        self.dy = 0
-                    break
-        return list(p)
-
-
-    def on-draw(self):
+        if self.model.idle():
+            self.milestone('full world')
+        # Physics runs in fixed steps, however long the frame took.
+        self.ticks = min(self.ticks + dt, physics.MAX_TICKS * physics.TICK)
+        while self.ticks >= physics.TICK:
+            self.ticks -= physics.TICK
+            start = list(self.player.pos)
+            self.player.update(physics.TICK,self.keys)
+            self.player.pos = self.collide(start, self.player.pos)
+
+    def collide(self, start, end):
+        """ Returns where the player ends up trying to move from `start` to
+        `end`, stopping at any block in the way.
+        """
+        if self.player.noclip:
+            return list(end)
+        motion = [e - s for s, e in zip(start, end)]
+        position, _ = physics.move(self.model.world, start, motion)
+        return position
+
+
+    def draw_game(self):
         self.clear()
         self.set3d()
         self.push(self.player.pos,self.player.rot)
-        self.model.draw()
+        self.model.draw(self.frustum())
         glPopMatrix()
+        self.milestone('first frame')
+        if self.model._shown:
+            self.milestone('first terrain')
     
+    def on_close(self):
+        self.model.close()
+        super().on_close()
+
     def on_draw(self):
         if not self.mainmenu:
-            self.on_draw()
+            self.draw_game()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,244 @@
+"""
+Builds the vertex arrays for one section of the world.
+
+Nothing in here touches OpenGL, so sections can be meshed (and benchmarked)
+without a window.
+"""
+import math
+
+import numpy
+
+SECTOR_SIZE = 16
+
+# Corners of each face of the unit cube at the origin, keyed by the direction
+# the face points in. The winding matches the quads `Model.cuboid` used to add
+# one at a time.
+FACE_VERTICES = {
+    ( 0, 1, 0): (0, 1, 1,  1, 1, 1,  1, 1, 0,  0, 1, 0),  # top
+    ( 0,-1, 0): (0, 0, 0,  1, 0, 0,  1, 0, 1,  0, 0, 1),  # bottom
+    (-1, 0, 0): (0, 0, 0,  0, 0, 1,  0, 1, 1,  0, 1, 0),
+    ( 1, 0, 0): (1, 0, 1,  1, 0, 0,  1, 1, 0,  1, 1, 1),
+    ( 0, 0, 1): (0, 0, 1,  1, 0, 1,  1, 1, 1,  0, 1, 1),
+    ( 0, 0,-1): (1, 0, 0,  0, 0, 0,  0, 1, 0,  1, 1, 0),
+}
+
+TEX_COORDS = (0, 0, 1, 0, 1, 1, 0, 1)
+
+
+def normalize(position):
+    """ Accepts `position` of arbitrary precision and returns the block
+    containing that position.
+    Parameters
+    ----------
+    position : tuple of len 3
+    Returns
+    -------
+    block_position : tuple of ints of len 3
+    """
+    x, y, z = position
+    x, y, z = (math.floor(x), math.floor(y), math.floor(z))
+    return (x, y, z)
+
+
+def sectorize(position):
+    """ Returns a tuple representing the section for the given block
+    `position`.
+    Parameters
+    ----------
+    position : tuple of ints of len 3
+    Returns
+    -------
+    sector : tuple of len 3
+    """
+    x, y, z = position
+    return (x // SECTOR_SIZE, y // SECTOR_SIZE, z // SECTOR_SIZE)
+
+
+def face_texture(block, face, greedy=False):
+    """ Returns the (texture group, uv rectangle) pair `block` uses for
+    `face`: its atlas tile, or with `greedy` a texture that can be repeated.
+    Block textures are given as (side, top, bottom).
+    """
+    textures = block.textures if greedy else block.tiles
+    if face[1] > 0:
+        return textures[1]
+    if face[1] < 0:
+        return textures[2]
+    return textures[0]
+
+
+def quad_tex_coords(rect):
+    """ Returns the texture coordinates of a quad covering the uv
+    rectangle `rect`, given as (u0, v0, u1, v1).
+    """
+    u0, v0, u1, v1 = rect
+    return (u0, v0, u1, v0, u1, v1, u0, v1)
+
+
+def exposed_faces(ids, cull=True, hidden=None):
+    """ Finds the faces of a section that are exposed to air.
+    Parameters
+    ----------
+    ids : array of shape (SECTOR_SIZE + 2,) * 3
+        Block ids of the section and of the one block thick shell around it,
+        indexed [x, y, z]. Id 0 is air.
+    cull : bool
+        Whether to drop faces covered by a neighbouring block. Without it
+        every block has all six faces.
+    hidden : array of bool, optional
+        Blocks of the section that are not drawn, although they still cover
+        the faces of their neighbours.
+    Returns
+    -------
+    faces : dict
+        Mapping of face to a (positions, ids) tuple: an (n, 3) array of the
+        exposed blocks' positions within the section and their block ids.
+    """
+    solid = ids != 0
+    inner = solid[1:-1, 1:-1, 1:-1]
+    drawn = inner if hidden is None else inner & ~hidden
+    size = inner.shape
+    faces = {}
+    for face in FACE_VERTICES:
+        mask = drawn
+        if cull:
+            dx, dy, dz = face
+            mask = mask & ~solid[1 + dx:1 + dx + size[0],
+                                 1 + dy:1 + dy + size[1],
+                                 1 + dz:1 + dz + size[2]]
+        faces[face] = (numpy.argwhere(mask), ids[1:-1, 1:-1, 1:-1][mask])
+    return faces
+
+
+def build_section(ids, origin, registry, colorize, greedy=False, cull=True,
+                  hidden=None):
+    """ Builds the vertex data for the faces of a section that are exposed to
+    air. Faces covered by a neighbouring block emit no geometry.
+    Parameters
+    ----------
+    ids, cull, hidden
+        As for `exposed_faces`.
+    origin : tuple of len 3
+        World position of the section's lowest corner.
+    registry : sequence
+        Maps block ids to blocks.
+    colorize : callable
+        Takes a y level and returns the (r, g, b) color of a top face.
+    greedy : bool
+        Whether to merge coplanar neighbouring faces that share a texture and
+        a color into larger quads. The texture is repeated across a merged
+        quad, so these use `block.textures` instead of the atlas tiles.
+    Returns
+    -------
+    arrays : dict
+        Mapping of texture group to a (vertices, tex_coords, colors) tuple of
+        flat lists, ready to be added to a batch as GL_QUADS.
+    """
+    chunks = {}
+    planes = {}
+    origin = numpy.array(origin)
+    for face, (positions, block_ids) in exposed_faces(ids, cull,
+                                                      hidden).items():
+        if not len(positions):
+            continue
+        positions += origin
+        if face[1] > 0:
+            levels, index = numpy.unique(positions[:, 1], return_inverse=True)
+            colors = numpy.array([colorize(y) for y in levels.tolist()])
+            colors = colors[index.reshape(-1)]
+        else:
+            colors = numpy.full((len(positions), 3), 255)
+        for id in numpy.unique(block_ids).tolist():
+            group, rect = face_texture(registry[id], face, greedy)
+            of_block = block_ids == id
+            if greedy:
+                axis, u, v = FACE_AXES[face]
+                for position, color in zip(positions[of_block].tolist(),
+                                           colors[of_block].tolist()):
+                    key = (face, position[axis], group, rect, tuple(color))
+                    if key not in planes:
+                        planes[key] = set()
+                    planes[key].add((position[u], position[v]))
+                continue
+            at = positions[of_block]
+            corners = numpy.array(FACE_VERTICES[face]).reshape(4, 3)
+            if group not in chunks:
+                chunks[group] = ([], [], [])
+            vertex_parts, tex_parts, color_parts = chunks[group]
+            vertex_parts.append((at[:, None, :] + corners).reshape(-1))
+            tex_parts.append(numpy.tile(quad_tex_coords(rect), len(at)))
+            color_parts.append(numpy.repeat(colors[of_block], 4, axis=0)
+                               .reshape(-1))
+    arrays = {group: tuple(numpy.concatenate(parts).tolist()
+                           for parts in chunk)
+              for group, chunk in chunks.items()}
+    for (face, plane, group, rect, color), cells in planes.items():
+        if group not in arrays:
+            arrays[group] = ([], [], [])
+        vertices, tex_coords, colors = arrays[group]
+        axis, u, v = FACE_AXES[face]
+        corners = FACE_VERTICES[face]
+        s_axis, t_axis = TEX_AXES[face]
+        u0, v0, u1, v1 = rect
+        for cu, cv, width, height in merge_cells(cells):
+            base = [0, 0, 0]
+            size = [1, 1, 1]
+            base[axis] = plane
+            base[u], base[v] = cu, cv
+            size[u], size[v] = width, height
+            for i in range(0, 12, 3):
+                vertices.extend((base[0] + corners[i] * size[0],
+                                 base[1] + corners[i + 1] * size[1],
+                                 base[2] + corners[i + 2] * size[2]))
+            for i in range(0, 8, 2):
+                tex_coords.extend(
+                    (u0 + TEX_COORDS[i] * size[s_axis] * (u1 - u0),
+                     v0 + TEX_COORDS[i + 1] * size[t_axis] * (v1 - v0)))
+            colors.extend(color * 4)
+    return arrays
+
+
+def merge_cells(cells):
+    """ Greedily covers a set of (u, v) grid `cells` with as few rectangles
+    as it can, growing each one along u first and then along v.
+    Returns
+    -------
+    rectangles : list of (u, v, width, height) tuples
+    """
+    cells = set(cells)
+    rectangles = []
+    for u, v in sorted(cells):
+        if (u, v) not in cells:
+            continue
+        width = 1
+        while (u + width, v) in cells:
+            width += 1
+        height = 1
+        while all((u + i, v + height) in cells for i in range(width)):
+            height += 1
+        for i in range(width):
+            for j in range(height):
+                cells.remove((u + i, v + j))
+        rectangles.append((u, v, width, height))
+    return rectangles
+
+
+def _face_axes(face):
+    axis = [abs(n) for n in face].index(1)
+    u, v = [a for a in range(3) if a != axis]
+    return axis, u, v
+
+
+def _tex_axes(corners):
+    # The s coordinate changes between the first two corners of a face and
+    # the t coordinate between the second and third.
+    s_axis = [corners[a] != corners[3 + a] for a in range(3)].index(True)
+    t_axis = [corners[3 + a] != corners[6 + a] for a in range(3)].index(True)
+    return s_axis, t_axis
+
+
+# For each face: the axis it is perpendicular to and the two axes spanning it.
+FACE_AXES = {face: _face_axes(face) for face in FACE_VERTICES}
+# For each face: the axes its s and t texture coordinates run along.
+TEX_AXES = {face: _tex_axes(corners)
+            for face, corners in FACE_VERTICES.items()}
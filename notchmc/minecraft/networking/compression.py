@@ -0,0 +1,109 @@
+"""Compression of packet payloads, with timing metrics.
+"""
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import timeit
+import zlib
+
+# How long to wait for more data to arrive on the socket before blocking on
+# a threaded decompression.
+POLL_INTERVAL = 0.001
+
+
+class Compression(object):
+    """Compresses outgoing and decompresses incoming packet payloads, and
+       records how long that takes.
+
+       Payloads that decompress to at least `threaded_size' bytes, such as
+       chunk data, are decompressed in a worker thread. zlib releases the
+       GIL while it works, so the networking thread can keep receiving in
+       the meantime.
+
+       Python's zlib objects cannot be reset, and cloning one costs as much
+       as creating it, so each payload is a one-shot call: compression at
+       the configured `level', and decompression into a buffer allocated
+       once at the size the packet announces.
+    """
+    def __init__(self, level=zlib.Z_DEFAULT_COMPRESSION, threaded_size=1 << 16):
+        self.level = level
+        self.threaded_size = threaded_size
+        self._executor = None
+        self._lock = threading.Lock()
+        self.reset_metrics()
+
+    def reset_metrics(self):
+        with self._lock:
+            self.compressed = 0
+            self.compress_bytes_in = 0
+            self.compress_bytes_out = 0
+            self.compress_seconds = 0.0
+            self.decompressed = 0
+            self.decompress_bytes_in = 0
+            self.decompress_bytes_out = 0
+            self.decompress_seconds = 0.0
+            self.threaded = 0
+
+    def compress(self, data):
+        start = timeit.default_timer()
+        compressed = zlib.compress(data, self.level)
+        seconds = timeit.default_timer() - start
+        with self._lock:
+            self.compressed += 1
+            self.compress_bytes_in += len(data)
+            self.compress_bytes_out += len(compressed)
+            self.compress_seconds += seconds
+        return compressed
+
+    def decompress(self, data, size, poll=None):
+        """Decompresses `data', which must decompress to exactly `size'
+           bytes. If the payload is big enough to go to the worker thread,
+           `poll' is called with POLL_INTERVAL while it is worked on, for as
+           long as it returns a true value.
+        """
+        if size < self.threaded_size:
+            return self._decompress(data, size)
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1)
+        future = self._executor.submit(self._decompress, data, size)
+        with self._lock:
+            self.threaded += 1
+        while poll is not None and not future.done() and poll(POLL_INTERVAL):
+            pass
+        return future.result()
+
+    def _decompress(self, data, size):
+        start = timeit.default_timer()
+        decompressed = zlib.decompress(data, zlib.MAX_WBITS, size)
+        seconds = timeit.default_timer() - start
+        assert len(decompressed) == size, \
+            'decompressed length %d, but expected %d' % \
+            (len(decompressed), size)
+        with self._lock:
+            self.decompressed += 1
+            self.decompress_bytes_in += len(data)
+            self.decompress_bytes_out += size
+            self.decompress_seconds += seconds
+        return decompressed
+
+    def metrics(self):
+        """Returns the counts, sizes and total times of the payloads
+           compressed and decompressed so far.
+        """
+        with self._lock:
+            return {
+                'level': self.level,
+                'compressed': self.compressed,
+                'compress_bytes_in': self.compress_bytes_in,
+                'compress_bytes_out': self.compress_bytes_out,
+                'compress_seconds': self.compress_seconds,
+                'decompressed': self.decompressed,
+                'decompress_bytes_in': self.decompress_bytes_in,
+                'decompress_bytes_out': self.decompress_bytes_out,
+                'decompress_seconds': self.decompress_seconds,
+                'threaded': self.threaded,
+            }
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
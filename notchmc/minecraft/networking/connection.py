@@ -6,7 +6,6 @@ import zlib
 import threading
 import socket
 import timeit
-import select
 import sys
 import json
 import re
@@ -17,6 +16,8 @@ from .types import VarInt
 from .packets import clientbound, serverbound
 from . import packets
 from . import encryption
+from .compression import Compression
+from .frames import FrameReader
 from .. import SUPPORTED_PROTOCOL_VERSIONS, SUPPORTED_MINECRAFT_VERSIONS
 from ..exceptions import (
     VersionMismatch, LoginDisconnect, IgnorePacket, InvalidState
@@ -36,15 +37,18 @@ class ConnectionContext(object):
     """
     def __init__(self, dimension=OVERWORLD, **kwds):
         self.protocol_version = kwds.get('protocol_version')
+        # The Compression used for packet payloads, if any.
+        self.compression = kwds.get('compression')
 
 
 class _ConnectionOptions(object):
     def __init__(self, address=None, port=None, compression_threshold=-1,
-                 compression_enabled=False):
+                 compression_enabled=False, lazy_decoding=False):
         self.address = address
         self.port = port
         self.compression_threshold = compression_threshold
         self.compression_enabled = compression_enabled
+        self.lazy_decoding = lazy_decoding
 
 
 class Connection(object):
@@ -62,6 +66,8 @@ class Connection(object):
         allowed_versions=None,
         handle_exception=None,
         handle_exit=None,
+        compression_level=zlib.Z_DEFAULT_COMPRESSION,
+        lazy_decoding=False,
     ):
         """Sets up an instance of this object to be able to connect to a
         minecraft server.
@@ -104,6 +110,17 @@ class Connection(object):
                             and not with the intention to automatically
                             reconnect. Exceptions raised from this function
                             will be handled by any matching exception handlers.
+        :param compression_level: The zlib level, from 0 to 9 or -1 for the
+                                  default, at which outgoing packets are
+                                  compressed once the server enables
+                                  compression. Timings are available from
+                                  'self.compression.metrics()'.
+        :param lazy_decoding: If 'True', incoming packets that no early or
+                              regular packet listener listens for, and that
+                              the current reactor does not react to, are
+                              skipped without being decoded, and the fields
+                              of the others are only decoded when one of
+                              them is first accessed.
         """  # NOQA
 
         # This lock is re-entrant because it may be acquired in a re-entrant
@@ -140,12 +157,15 @@ class Connection(object):
         else:
             self.default_proto_version = proto_version(initial_version)
 
+        self.compression = Compression(compression_level)
         self.context = ConnectionContext(
-            protocol_version=max(self.allowed_proto_versions))
+            protocol_version=max(self.allowed_proto_versions),
+            compression=self.compression)
 
         self.options = _ConnectionOptions()
         self.options.address = address
         self.options.port = port
+        self.options.lazy_decoding = lazy_decoding
         self.auth_token = auth_token
         self.username = username
         self.connected = False
@@ -191,6 +211,7 @@ class Connection(object):
         if force:
             with self._write_lock:
                 self._write_packet(packet)
+                self._flush()
         else:
             self._outgoing_packet_queue.append(packet)
 
@@ -300,22 +321,34 @@ class Connection(object):
             return True
 
     def _write_packet(self, packet):
-        # Immediately writes the given packet to the network. The caller must
-        # have the write lock acquired before calling this method.
+        # Adds the given packet to the outgoing batch, which is written to
+        # the network by the next call to '_flush'. The caller must have the
+        # write lock acquired before calling this method.
         try:
             for listener in self.early_outgoing_packet_listeners:
                 listener.call_packet(packet)
 
             if self.options.compression_enabled:
-                packet.write(self.socket, self.options.compression_threshold)
+                packet.write(self._outgoing_batch,
+                             self.options.compression_threshold)
             else:
-                packet.write(self.socket)
+                packet.write(self._outgoing_batch)
 
             for listener in self.outgoing_packet_listeners:
                 listener.call_packet(packet)
         except IgnorePacket:
             pass
 
+    def _flush(self):
+        # Writes out the outgoing batch, every packet queued since the last
+        # flush, with one call to the socket and without copying it. That
+        # also means one call to the encryptor once encryption is enabled.
+        # The caller must have the write lock acquired.
+        with self._outgoing_batch.getbuffer() as data:
+            if data:
+                self.socket.sendall(data)
+        self._outgoing_batch.reset()
+
     def status(self, handle_status=None, handle_ping=False):
         """Issue a status request to the server and then disconnect.
 
@@ -395,13 +428,12 @@ class Connection(object):
             raise InvalidState('There is an existing connection.')
 
     def _connect(self):
-        # Connect a socket to the server and create a file object from the
-        # socket.
-        # The file object is used to read any and all data from the socket
-        # since it's "guaranteed" to read the number of bytes specified,
-        # the socket itself will mostly be used to write data upstream to
-        # the server.
+        # Connect a socket to the server and create a frame reader for it.
+        # The frame reader receives any and all data from the socket into
+        # one buffer and cuts it into packets; the socket itself is only
+        # used directly to write data upstream to the server.
         self._outgoing_packet_queue = deque()
+        self._outgoing_batch = packets.PacketBuffer()
 
         info = socket.getaddrinfo(self.options.address, self.options.port,
                                   0, socket.SOCK_STREAM)
@@ -416,7 +448,7 @@ class Connection(object):
 
         self.socket = socket.socket(ai_faml, ai_type, ai_prot)
         self.socket.connect(ai_addr)
-        self.file_object = self.socket.makefile("rb", 0)
+        self.file_object = FrameReader(self.socket)
         self.options.compression_enabled = False
         self.options.compression_threshold = -1
         self.connected = True
@@ -432,6 +464,7 @@ class Connection(object):
                 # Flush any packets remaining in the queue.
                 while self._pop_packet():
                     pass
+                self._flush()
 
             if self.networking_thread is not None:
                 self.networking_thread.interrupt = True
@@ -445,6 +478,10 @@ class Connection(object):
                     self.socket.close()
                     self.socket = None
 
+            # Stop the decompression thread, if one was started. A later
+            # connection starts a new one when it needs it.
+            self.compression.shutdown()
+
     def _handshake(self, next_state=STATE_PLAYING):
         handshake = serverbound.handshake.HandShakePacket()
         handshake.protocol_version = self.context.protocol_version
@@ -514,6 +551,17 @@ class Connection(object):
         if not self.connected and self.handle_exit is not None:
             self.handle_exit()
 
+    def _packet_wanted(self, packet_class):
+        # Whether incoming packets of the given class are used by the current
+        # reactor or by any early or regular packet listener.
+        if packet_class.packet_name in self.reactor.reacts_to:
+            return True
+        for listener in self.early_packet_listeners + self.packet_listeners:
+            for packet_type in listener.packets_to_listen:
+                if issubclass(packet_class, packet_type):
+                    return True
+        return False
+
     def _react(self, packet):
         try:
             for listener in self.early_packet_listeners:
@@ -562,6 +610,7 @@ class NetworkingThread(threading.Thread):
                         num_packets += 1
                         if num_packets >= 300:
                             break
+                    self.connection._flush()
                     exc_info = None
                 except IOError:
                     exc_info = sys.exc_info()
@@ -600,6 +649,11 @@ class PacketReactor(object):
     """
     state_name = None
 
+    # The names of the packets 'react' does anything with. With lazy
+    # decoding, other packets are only decoded if a listener wants them, so
+    # subclasses that react to more packets must list them here.
+    reacts_to = frozenset()
+
     # Handshaking is considered the "default" state
     get_clientbound_packets = staticmethod(clientbound.handshake.get_packets)
 
@@ -611,30 +665,23 @@ class PacketReactor(object):
             for packet in self.__class__.get_clientbound_packets(context)}
 
     def read_packet(self, stream, timeout=0):
-        # Block for up to `timeout' seconds waiting for `stream' to become
-        # readable, returning `None' if the timeout elapses.
-        ready_to_read = select.select([stream], [], [], timeout)[0]
-
-        if ready_to_read:
-            length = VarInt.read(stream)
-
+        # Block for up to `timeout' seconds waiting for `stream', a
+        # FrameReader, to become readable, returning `None' if the timeout
+        # elapses.
+        if stream.ready(timeout):
             packet_data = packets.PacketBuffer()
-            packet_data.send(stream.read(length))
-            # Ensure we read all the packet
-            while len(packet_data.get_writable()) < length:
-                packet_data.send(
-                    stream.read(length - len(packet_data.get_writable())))
+            packet_data.send(stream.read_frame())
             packet_data.reset_cursor()
 
             if self.connection.options.compression_enabled:
                 decompressed_size = VarInt.read(packet_data)
                 if decompressed_size > 0:
-                    decompressor = zlib.decompressobj()
-                    decompressed_packet = decompressor.decompress(
-                                                       packet_data.read())
-                    assert len(decompressed_packet) == decompressed_size, \
-                        'decompressed length %d, but expected %d' % \
-                        (len(decompressed_packet), decompressed_size)
+                    # Big payloads are decompressed in a worker thread while
+                    # this one keeps receiving.
+                    decompressed_packet = \
+                        self.connection.compression.decompress(
+                            packet_data.read(), decompressed_size,
+                            stream.prefetch)
                     packet_data.reset()
                     packet_data.send(decompressed_packet)
                     packet_data.reset_cursor()
@@ -642,11 +689,18 @@ class PacketReactor(object):
             packet_id = VarInt.read(packet_data)
 
             # If we know the structure of the packet, attempt to parse it
-            # otherwise just skip it
-            if packet_id in self.clientbound_packets:
-                packet = self.clientbound_packets[packet_id]()
+            # otherwise just skip it. With lazy decoding, packets nobody uses
+            # are skipped too, and the others are parsed on first use.
+            packet_class = self.clientbound_packets.get(packet_id)
+            lazy = self.connection.options.lazy_decoding
+            if packet_class is not None and \
+               (not lazy or self.connection._packet_wanted(packet_class)):
+                packet = packet_class()
                 packet.context = self.connection.context
-                packet.read(packet_data)
+                if lazy:
+                    packet.read_later(packet_data)
+                else:
+                    packet.read(packet_data)
                 return packet
             else:
                 return packets.Packet(context=self.connection.context)
@@ -671,6 +725,9 @@ class PacketReactor(object):
 
 class LoginReactor(PacketReactor):
     get_clientbound_packets = staticmethod(clientbound.login.get_packets)
+    reacts_to = frozenset((
+        "encryption request", "disconnect", "login success",
+        "set compression", "login plugin request"))
 
     def react(self, packet):
         if packet.packet_name == "encryption request":
@@ -700,9 +757,7 @@ class LoginReactor(PacketReactor):
             decryptor = cipher.decryptor()
             self.connection.socket = encryption.EncryptedSocketWrapper(
                 self.connection.socket, encryptor, decryptor)
-            self.connection.file_object = \
-                encryption.EncryptedFileObjectWrapper(
-                    self.connection.file_object, decryptor)
+            self.connection.file_object.decryptor = decryptor
 
         elif packet.packet_name == "disconnect":
             # Receiving a disconnect packet in the login state indicates an
@@ -734,6 +789,9 @@ class LoginReactor(PacketReactor):
 
 class PlayingReactor(PacketReactor):
     get_clientbound_packets = staticmethod(clientbound.play.get_packets)
+    reacts_to = frozenset((
+        "set compression", "keep alive", "player position and look",
+        "disconnect"))
 
     def react(self, packet):
         if packet.packet_name == "set compression":
@@ -763,11 +821,10 @@ class PlayingReactor(PacketReactor):
 
         elif packet.packet_name == "disconnect":
             self.connection.disconnect()
-        elif packet.packet_name == "chunk data":
-            print(packet) #debug
 
 class StatusReactor(PacketReactor):
     get_clientbound_packets = staticmethod(clientbound.status.get_packets)
+    reacts_to = frozenset(("response", "ping"))
 
     def __init__(self, connection, do_ping=False):
         super(StatusReactor, self).__init__(connection)
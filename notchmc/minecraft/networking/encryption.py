@@ -62,21 +62,6 @@ def _number_from_bytes(b, signed=False):
         return num
 
 
-class EncryptedFileObjectWrapper(object):
-    def __init__(self, file_object, decryptor):
-        self.actual_file_object = file_object
-        self.decryptor = decryptor
-
-    def read(self, length):
-        return self.decryptor.update(self.actual_file_object.read(length))
-
-    def fileno(self):
-        return self.actual_file_object.fileno()
-
-    def close(self):
-        self.actual_file_object.close()
-
-
 class EncryptedSocketWrapper(object):
     def __init__(self, socket, encryptor, decryptor):
         self.actual_socket = socket
@@ -89,6 +74,9 @@ class EncryptedSocketWrapper(object):
     def send(self, data):
         self.actual_socket.send(self.encryptor.update(data))
 
+    def sendall(self, data):
+        self.actual_socket.sendall(self.encryptor.update(data))
+
     def fileno(self):
         return self.actual_socket.fileno()
 
@@ -0,0 +1,121 @@
+"""Buffered reading of length-prefixed packet frames from a socket.
+"""
+import select
+
+# Spare room a decryptor needs past the end of its output: one AES block,
+# less a byte.
+DECRYPT_SLACK = 15
+
+
+class FrameReader(object):
+    """Receives data from a socket into one reusable buffer, in as few
+       'recv_into' calls as possible, and cuts it into packet frames.
+
+       A frame is a VarInt length followed by that many bytes. Frames are
+       returned as memoryviews into the buffer, so a frame must be consumed
+       (or copied) before more data is received.
+
+       Once `decryptor' is set, every received block is decrypted in place
+       with a single call.
+    """
+    def __init__(self, socket, size=1 << 16, decryptor=None):
+        self.socket = socket
+        self.decryptor = decryptor
+        self.buffer = bytearray(size)
+        self.view = memoryview(self.buffer)
+        # The unread data is self.buffer[self.start:self.end].
+        self.start = 0
+        self.end = 0
+
+    def fileno(self):
+        return self.socket.fileno()
+
+    def pending(self):
+        """The number of bytes received but not yet returned in a frame."""
+        return self.end - self.start
+
+    def ready(self, timeout=0):
+        """Returns True if there is data to read, waiting for up to `timeout'
+           seconds for the socket to become readable if none is buffered.
+        """
+        return self.start < self.end or \
+            bool(select.select([self], [], [], timeout)[0])
+
+    def fill(self):
+        """Receives as much data as the socket has (blocking until there is
+           some) and returns the number of bytes received.
+        """
+        slack = DECRYPT_SLACK if self.decryptor is not None else 0
+        if self.start == self.end:
+            self.start = self.end = 0
+        if self.end + slack >= len(self.buffer):
+            self._reserve(self.end - self.start + slack + 1)
+        received = self.socket.recv_into(
+            self.view[self.end:len(self.buffer) - slack])
+        if not received:
+            raise EOFError("Unexpected end of message.")
+        if self.decryptor is not None:
+            self.decryptor.update_into(
+                self.view[self.end:self.end + received], self.view[self.end:])
+        self.end += received
+        return received
+
+    def prefetch(self, timeout=0):
+        """Receives whatever data arrives within `timeout' seconds, as long
+           as there is room for it without growing the buffer, and returns
+           the number of bytes received.
+        """
+        slack = DECRYPT_SLACK if self.decryptor is not None else 0
+        if self.end - self.start + slack >= len(self.buffer) or \
+           not select.select([self], [], [], timeout)[0]:
+            return 0
+        return self.fill()
+
+    def _reserve(self, length):
+        # Makes room for `length' bytes from self.start, moving the unread
+        # data to the front of the buffer and growing it if necessary.
+        pending = self.end - self.start
+        if length > len(self.buffer):
+            buffer = bytearray(max(length, 2 * len(self.buffer)))
+            buffer[:pending] = self.view[self.start:self.end]
+            self.buffer, self.view = buffer, memoryview(buffer)
+        elif self.start:
+            self.view[:pending] = self.view[self.start:self.end]
+        self.start, self.end = 0, pending
+
+    def _header(self):
+        # Returns (length, size of the VarInt) for the frame at self.start,
+        # or None if its header has not been fully received.
+        number = 0
+        for i in range(min(5, self.end - self.start)):
+            byte = self.buffer[self.start + i]
+            number |= (byte & 0x7F) << 7 * i
+            if not byte & 0x80:
+                return number, i + 1
+        if self.end - self.start >= 5:
+            raise ValueError("Tried to read too long of a VarInt")
+        return None
+
+    def next_frame(self):
+        """Returns the next frame as a memoryview if it has been fully
+           received, otherwise None.
+        """
+        header = self._header()
+        if header is None:
+            return None
+        length, size = header
+        if self.end - self.start < size + length:
+            if self.start + size + length > len(self.buffer):
+                self._reserve(size + length)
+            return None
+        start = self.start + size
+        self.start = start + length
+        return self.view[start:self.start]
+
+    def read_frame(self):
+        """Returns the next frame, blocking until it has been received."""
+        frame = self.next_frame()
+        while frame is None:
+            self.fill()
+            frame = self.next_frame()
+        return frame
@@ -13,6 +13,7 @@ class ChunkDataPacket(Packet):
 
     packet_name = 'chunk data'
     fields = 'x', 'bit_mask_y', 'z', 'full_chunk'
+    _chunks = None
 
     def read(self, file_object):
         self.x = Integer.read(file_object)
@@ -31,7 +32,16 @@ class ChunkDataPacket(Packet):
         for i in range(size_entities):
             self.entities.append(Nbt.read(file_object))
 
-        self.decode_chunk_data()
+    @property
+    def chunks(self):
+        # The chunk sections are only decoded once they are first accessed.
+        if self._chunks is None:
+            self.decode_chunk_data()
+        return self._chunks
+
+    @chunks.setter
+    def chunks(self, chunks):
+        self._chunks = chunks
 
     def write_fields(self, packet_buffer):
         Integer.send(self.x, packet_buffer)
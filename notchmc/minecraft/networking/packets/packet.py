@@ -64,29 +64,39 @@ class Packet(object):
                 value = data_type.read_with_context(file_object, self.context)
                 setattr(self, var_name, value)
 
+    def read_later(self, file_object):
+        # Keeps the rest of the packet's data, to be read by 'read' the first
+        # time an attribute that has not been set is accessed. Until then the
+        # packet's class is swapped for a subclass that defines '__getattr__',
+        # as defining it on Packet itself slows down attribute access on
+        # every packet.
+        self._unread = file_object.read()
+        cls = type(self)
+        if cls not in _unread_classes:
+            _unread_classes[cls] = type(cls.__name__, (_UnreadPacket, cls),
+                                        {'__module__': cls.__module__})
+        self.__class__ = _unread_classes[cls]
+
     # Writes a packet buffer to the socket with the appropriate headers
-    # and compressing the data if necessary
+    # and compressing the data if necessary. The whole packet is written with
+    # a single call.
     def _write_buffer(self, socket, packet_buffer, compression_threshold):
+        packet_data = packet_buffer.get_writable()
         # compression_threshold of None means compression is disabled
         if compression_threshold is not None:
-            if len(packet_buffer.get_writable()) > compression_threshold != -1:
-                # compress the current payload
-                packet_data = packet_buffer.get_writable()
-                compressed_data = compress(packet_data)
-                packet_buffer.reset()
-                # write out the length of the uncompressed payload
-                VarInt.send(len(packet_data), packet_buffer)
-                # write the compressed payload itself
-                packet_buffer.send(compressed_data)
+            if len(packet_data) > compression_threshold != -1:
+                # write out the length of the uncompressed payload and the
+                # compressed payload itself
+                compression = self.context.compression
+                compressed = compress(packet_data) if compression is None \
+                    else compression.compress(packet_data)
+                packet_data = VarInt.encode(len(packet_data)) + compressed
             else:
                 # write out a 0 to indicate uncompressed data
-                packet_data = packet_buffer.get_writable()
-                packet_buffer.reset()
-                VarInt.send(0, packet_buffer)
-                packet_buffer.send(packet_data)
+                packet_data = b'\x00' + packet_data
 
-        VarInt.send(len(packet_buffer.get_writable()), socket)  # Packet Size
-        socket.send(packet_buffer.get_writable())  # Packet Payload
+        # Packet Size and Packet Payload
+        socket.send(VarInt.encode(len(packet_data)) + packet_data)
 
     def write(self, socket, compression_threshold=None):
         # buffer the data since we need to know the length of each packet's
@@ -148,3 +158,21 @@ class Packet(object):
             enum_class = getattr(cls, enum_name)
             if isinstance(enum_class, type) and issubclass(enum_class, Enum):
                 return enum_class
+
+
+# The '_UnreadPacket' subclass of each packet class that has been read with
+# 'Packet.read_later'.
+_unread_classes = {}
+
+
+class _UnreadPacket(object):
+    def __getattr__(self, name):
+        # Only called for attributes that are not set.
+        if name.startswith('__'):
+            raise AttributeError(name)
+        self.__class__ = type(self).__bases__[1]
+        packet_data = PacketBuffer()
+        packet_data.send(self.__dict__.pop('_unread'))
+        packet_data.reset_cursor()
+        self.read(packet_data)
+        return getattr(self, name)
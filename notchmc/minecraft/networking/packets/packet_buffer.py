@@ -26,3 +26,10 @@ class PacketBuffer(object):
 
     def get_writable(self):
         return self.bytes.getvalue()
+
+    def getbuffer(self):
+        """
+        Returns a memoryview of the written bytes without copying them. The
+        buffer cannot be written to or reset until the view is released.
+        """
+        return self.bytes.getbuffer()
@@ -154,7 +154,7 @@ class VarInt(Type):
         return number
 
     @staticmethod
-    def send(value, socket):
+    def encode(value):
         out = bytes()
         while True:
             byte = value & 0x7F
@@ -162,7 +162,11 @@ class VarInt(Type):
             out += struct.pack("B", byte | (0x80 if value > 0 else 0))
             if value == 0:
                 break
-        socket.send(out)
+        return out
+
+    @staticmethod
+    def send(value, socket):
+        socket.send(VarInt.encode(value))
 
     @staticmethod
     def size(value):
@@ -0,0 +1,90 @@
+"""
+Swept axis-aligned bounding box collision against the block storage.
+
+Block (x, y, z) is the unit cube from (x, y, z) to (x + 1, y + 1, z + 1):
+the cube `mesh` draws for it, and the one `normalize` maps the points in it
+to. A move is resolved one axis at a time, and every cell the box sweeps
+through on that axis is checked, so fast bodies cannot tunnel through thin
+walls.
+"""
+import math
+
+# Seconds simulated by one physics step, and the most steps run per frame so
+# a slow frame cannot snowball into an ever longer one.
+TICK = 1 / 60
+MAX_TICKS = 5
+# The furthest a body may move along one axis in one step, which bounds the
+# number of cells checked per step.
+MAX_MOVE = 16
+# Slack that keeps a body resting against a face from counting as inside it.
+EPSILON = 1e-6
+
+# The player's box relative to their eye position: a quarter block either
+# side, from 1.25 below the eye to 0.25 above it.
+PLAYER_BOX = ((-0.25, -1.25, -0.25), (0.25, 0.25, 0.25))
+
+
+def _cells(low, high):
+    # The cell indices a box from `low` to `high` overlaps on one axis.
+    return range(math.floor(low + EPSILON), math.ceil(high - EPSILON))
+
+
+def footprint(position, box=PLAYER_BOX):
+    """ Returns the (x, z) block columns a body with the given `box` at
+    `position` overlaps.
+    """
+    return [(x, z)
+            for x in _cells(position[0] + box[0][0], position[0] + box[1][0])
+            for z in _cells(position[2] + box[0][2], position[2] + box[1][2])]
+
+
+def sweep_axis(world, low, high, axis, distance):
+    """ Returns how far the box from `low` to `high` can move along `axis`,
+    up to `distance`, before it runs into a block of `world`.
+    """
+    others = [a for a in range(3) if a != axis]
+    across = [(a, _cells(low[a], high[a])) for a in others]
+    if distance > 0:
+        cell = math.ceil(high[axis] - EPSILON)
+        cells = range(cell, math.floor(high[axis] + distance) + 1)
+    else:
+        cell = math.floor(low[axis] + EPSILON) - 1
+        cells = range(cell, math.ceil(low[axis] + distance) - 2, -1)
+    (a, first), (b, second) = across
+    position = [0, 0, 0]
+    for cell in cells:
+        position[axis] = cell
+        for i in first:
+            position[a] = i
+            for j in second:
+                position[b] = j
+                if tuple(position) in world:
+                    if distance > 0:
+                        return max(0.0, cell - high[axis])
+                    return min(0.0, cell + 1 - low[axis])
+    return distance
+
+
+def move(world, position, motion, box=PLAYER_BOX):
+    """ Moves a body with the given `box` from `position` by `motion`,
+    stopping it at the first block on each axis. Vertical motion is
+    resolved first, then x, then z.
+    Returns
+    -------
+    position : list of len 3
+        Where the body ends up.
+    blocked : list of bool of len 3
+        For each axis, whether a block cut the motion short.
+    """
+    position = list(position)
+    blocked = [False, False, False]
+    for axis in (1, 0, 2):
+        distance = max(-MAX_MOVE, min(MAX_MOVE, motion[axis]))
+        if not distance:
+            continue
+        low = [p + o for p, o in zip(position, box[0])]
+        high = [p + o for p, o in zip(position, box[1])]
+        moved = sweep_axis(world, low, high, axis, distance)
+        blocked[axis] = moved != distance
+        position[axis] += moved
+    return position, blocked
@@ -0,0 +1,126 @@
+"""
+Exact voxel traversal (Amanatides & Woo, "A Fast Voxel Traversal Algorithm
+for Ray Tracing") against the block storage.
+
+Block (x, y, z) is the unit cube from (x, y, z) to (x + 1, y + 1, z + 1),
+the cube `mesh` draws for it and `normalize` maps the points in it to.
+"""
+import math
+
+import numpy
+
+from mesh import normalize
+
+
+def raycast(world, position, vector, max_distance=8):
+    """ Visits every block the ray from `position` along `vector` passes
+    through, in order, until it reaches a block in `world` or travels
+    `max_distance`.
+    Returns
+    -------
+    block : tuple of len 3 or None
+        The first block hit.
+    previous : tuple of len 3 or None
+        The block the ray passed through just before it. None if nothing was
+        hit, or if the ray starts inside a block.
+    face : tuple of len 3 or None
+        The normal of the face of `block` the ray entered through, pointing
+        back towards `previous`.
+    """
+    cell = list(normalize(position))
+    if tuple(cell) in world:
+        return tuple(cell), None, None
+    length = math.sqrt(sum(d * d for d in vector))
+    if not length:
+        return None, None, None
+    limit = max_distance / length
+    step, t_max, t_delta = [0] * 3, [math.inf] * 3, [math.inf] * 3
+    for axis in range(3):
+        d = vector[axis]
+        if d > 0:
+            step[axis] = 1
+            t_max[axis] = (cell[axis] + 1 - position[axis]) / d
+            t_delta[axis] = 1 / d
+        elif d < 0:
+            step[axis] = -1
+            t_max[axis] = (cell[axis] - position[axis]) / d
+            t_delta[axis] = -1 / d
+    while True:
+        axis = t_max.index(min(t_max))
+        if t_max[axis] > limit:
+            return None, None, None
+        previous = tuple(cell)
+        cell[axis] += step[axis]
+        t_max[axis] += t_delta[axis]
+        if tuple(cell) in world:
+            face = [0, 0, 0]
+            face[axis] = -step[axis]
+            return tuple(cell), previous, tuple(face)
+
+
+def raycast_many(world, positions, vectors, max_distance=8):
+    """ Casts many rays at once, stepping all of them through the grid
+    together with array operations.
+    Parameters
+    ----------
+    positions, vectors : arrays of shape (n, 3)
+        Start point and direction of each ray.
+    max_distance : float or array of shape (n,)
+        How far each ray may travel.
+    Returns
+    -------
+    hit : array of bool, shape (n,)
+        Whether each ray hit a block.
+    blocks, previous, faces : int arrays of shape (n, 3)
+        As returned by `raycast`, for the rays that hit. A ray that starts
+        inside a block hits it with a zero face.
+    """
+    positions = numpy.asarray(positions, float)
+    vectors = numpy.asarray(vectors, float)
+    n = len(positions)
+    rows = numpy.arange(n)
+    cells = numpy.floor(positions).astype(numpy.int64)
+    length = numpy.sqrt((vectors ** 2).sum(axis=1))
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        limit = numpy.where(length > 0, max_distance / length, -1.0)
+        step = numpy.sign(vectors).astype(numpy.int64)
+        t_delta = numpy.where(step != 0, 1 / numpy.abs(vectors), numpy.inf)
+        t_max = numpy.where(step != 0,
+                            (cells + (step > 0) - positions) / vectors,
+                            numpy.inf)
+    hit = world.get_ids(cells) != 0
+    blocks = cells.copy()
+    previous = cells.copy()
+    faces = numpy.zeros((n, 3), numpy.int64)
+    active = ~hit & (limit >= 0)
+    while active.any():
+        axis = t_max.argmin(axis=1)
+        t = t_max[rows, axis]
+        active &= t <= limit
+        index = numpy.flatnonzero(active)
+        if not len(index):
+            break
+        axis = axis[index]
+        previous[index] = cells[index]
+        cells[index, axis] += step[index, axis]
+        t_max[index, axis] += t_delta[index, axis]
+        solid = world.get_ids(cells[index]) != 0
+        entered, axis = index[solid], axis[solid]
+        hit[entered] = True
+        active[entered] = False
+        blocks[entered] = cells[entered]
+        faces[entered, axis] = -step[entered, axis]
+    return hit, blocks, previous, faces
+
+
+def line_of_sight(world, origins, targets):
+    """ Returns an array of bool telling for each pair of points whether the
+    segment from the origin to the target is free of blocks. A block at the
+    target itself does not block the view of it.
+    """
+    origins = numpy.asarray(origins, float)
+    targets = numpy.asarray(targets, float)
+    vectors = targets - origins
+    distance = numpy.sqrt((vectors ** 2).sum(axis=1))
+    hit, blocks, _, _ = raycast_many(world, origins, vectors, distance)
+    return ~hit | (blocks == numpy.floor(targets)).all(axis=1)
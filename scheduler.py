@@ -0,0 +1,113 @@
+"""
+A time-budgeted priority queue for the work `Model.update` does each frame.
+"""
+import heapq
+import itertools
+import time
+from collections import defaultdict
+
+# Jobs of an earlier kind run before jobs of a later one.
+KINDS = ('hide', 'show', 'generate')
+
+
+class Job:
+    __slots__ = ('kind', 'position', 'func', 'args', 'tag', 'cancelled')
+
+    def __init__(self, kind, position, func, args, tag):
+        self.kind = kind
+        self.position = position
+        self.func = func
+        self.args = args
+        self.tag = tag
+        self.cancelled = False
+
+
+class Scheduler:
+    """ Runs queued jobs ordered by kind, then by distance from `origin`,
+    for at most `budget` milliseconds per call to `run`. Jobs can be given a
+    tag so that all of them are cancelled at once when their work becomes
+    obsolete.
+    """
+    def __init__(self, budget=4):
+        self.budget = budget
+        self.origin = (0, 0, 0)
+        self.heap = []
+        self.tags = defaultdict(set)
+        self.counter = itertools.count()
+        # Number of jobs waiting to run, excluding cancelled ones.
+        self.depth = 0
+        # Jobs run and milliseconds spent by the last call to `run`.
+        self.ran = 0
+        self.used = 0.0
+        # Jobs cancelled since the scheduler was created.
+        self.cancelled = 0
+
+    def __len__(self):
+        return self.depth
+
+    def priority(self, job):
+        x, y, z = job.position
+        ox, oy, oz = self.origin
+        distance = (x - ox) ** 2 + (y - oy) ** 2 + (z - oz) ** 2
+        return (KINDS.index(job.kind), distance)
+
+    def push(self, kind, position, func, *args, tag=None):
+        """ Queues `func(*args)` as a job of `kind` concerning the block at
+        `position`.
+        """
+        job = Job(kind, position, func, args, tag)
+        heapq.heappush(self.heap, (self.priority(job), next(self.counter), job))
+        if tag is not None:
+            self.tags[tag].add(job)
+        self.depth += 1
+
+    def cancel(self, tag):
+        """ Cancels every queued job with the given `tag`. """
+        for job in self.tags.pop(tag, ()):
+            job.cancelled = True
+            self.depth -= 1
+            self.cancelled += 1
+
+    def reprioritize(self, origin):
+        """ Orders the queued jobs by their distance from a new `origin`,
+        dropping the cancelled ones.
+        """
+        self.origin = origin
+        self.heap = [(self.priority(job), count, job)
+                     for _, count, job in self.heap if not job.cancelled]
+        heapq.heapify(self.heap)
+
+    def run(self):
+        """ Runs jobs until the queue is empty or the budget is used up. At
+        least one job runs per call, so the queue always makes progress.
+        """
+        start = time.perf_counter()
+        deadline = start + self.budget / 1000
+        self.ran = 0
+        while self.heap:
+            if self.ran and time.perf_counter() >= deadline:
+                break
+            _, _, job = heapq.heappop(self.heap)
+            if job.cancelled:
+                continue
+            if job.tag is not None:
+                self.tags[job.tag].discard(job)
+                if not self.tags[job.tag]:
+                    del self.tags[job.tag]
+            self.depth -= 1
+            job.func(*job.args)
+            self.ran += 1
+        self.used = (time.perf_counter() - start) * 1000
+
+    def metrics(self):
+        """ Returns the queue depth and budget use of the last frame. The
+        budget use is None without a budget, when only one job runs per call.
+        """
+        return {
+            'depth': self.depth,
+            'ran': self.ran,
+            'used_ms': self.used,
+            'budget_ms': self.budget,
+            'budget_use': self.used / self.budget if self.budget > 0 else None,
+            'cancelled': self.cancelled,
+        }
@@ -0,0 +1,176 @@
+"""
+Array-backed block storage for the world.
+
+Every non-empty 16x16x16 section is one uint16 NumPy array of block ids,
+indexed [x, y, z] relative to the section's lowest corner. Id 0 is air and
+sections holding only air are not stored at all, so a loaded world costs
+about two bytes per block.
+"""
+import numpy
+
+from mesh import SECTOR_SIZE, sectorize
+
+AIR = 0
+
+
+class BlockRegistry:
+    """ Gives every block type a small integer id so it can be stored in
+    arrays. Id 0 is reserved for air.
+    """
+    def __init__(self):
+        self.blocks = [None]
+
+    def register(self, block):
+        """ Assigns the next free id to `block`, stores it as `block.id` and
+        returns the block.
+        """
+        block.id = len(self.blocks)
+        self.blocks.append(block)
+        return block
+
+    def __getitem__(self, id):
+        return self.blocks[id]
+
+    def __len__(self):
+        return len(self.blocks)
+
+
+class ChunkStorage:
+    """ Maps block positions to blocks like a dict, but keeps them in one
+    array of block ids per section. Missing positions raise KeyError rather
+    than being inserted.
+    """
+    def __init__(self, registry):
+        self.registry = registry
+        # Mapping from section to its array of block ids.
+        self.sections = {}
+        # Mapping from section to the number of blocks in it.
+        self.counts = {}
+
+    def __len__(self):
+        return sum(self.counts.values())
+
+    def __contains__(self, position):
+        x, y, z = position
+        blocks = self.sections.get(sectorize(position))
+        return blocks is not None and \
+            blocks[x % SECTOR_SIZE, y % SECTOR_SIZE, z % SECTOR_SIZE] != AIR
+
+    def __getitem__(self, position):
+        id = self.get_id(position)
+        if id == AIR:
+            raise KeyError(position)
+        return self.registry[id]
+
+    def get(self, position, default=None):
+        id = self.get_id(position)
+        return default if id == AIR else self.registry[id]
+
+    def get_id(self, position):
+        """ Returns the id of the block at `position`, or AIR. """
+        x, y, z = position
+        blocks = self.sections.get(sectorize(position))
+        if blocks is None:
+            return AIR
+        return int(blocks[x % SECTOR_SIZE, y % SECTOR_SIZE, z % SECTOR_SIZE])
+
+    def get_ids(self, positions):
+        """ Returns the block ids at an (n, 3) array of integer `positions`,
+        looking up each section once.
+        """
+        positions = numpy.asarray(positions)
+        ids = numpy.zeros(len(positions), numpy.uint16)
+        if not len(positions):
+            return ids
+        sectors, inverse = numpy.unique(positions // SECTOR_SIZE, axis=0,
+                                        return_inverse=True)
+        inverse = inverse.reshape(-1)
+        local = positions % SECTOR_SIZE
+        for i, sector in enumerate(sectors.tolist()):
+            blocks = self.sections.get(tuple(sector))
+            if blocks is None:
+                continue
+            at = inverse == i
+            ids[at] = blocks[local[at, 0], local[at, 1], local[at, 2]]
+        return ids
+
+    def __setitem__(self, position, block):
+        self.set_id(position, block.id)
+
+    def __delitem__(self, position):
+        if position not in self:
+            raise KeyError(position)
+        self.set_id(position, AIR)
+
+    def set_id(self, position, id):
+        """ Stores block `id` at `position`, allocating or freeing its
+        section as needed.
+        """
+        x, y, z = position
+        sector = sectorize(position)
+        blocks = self.sections.get(sector)
+        if blocks is None:
+            if id == AIR:
+                return
+            blocks = self.sections[sector] = numpy.zeros(
+                (SECTOR_SIZE,) * 3, numpy.uint16)
+            self.counts[sector] = 0
+        index = (x % SECTOR_SIZE, y % SECTOR_SIZE, z % SECTOR_SIZE)
+        self.counts[sector] += int(id != AIR) - int(blocks[index] != AIR)
+        blocks[index] = id
+        if not self.counts[sector]:
+            self.unload(sector)
+
+    def unload(self, sector):
+        """ Drops every block of `sector`. """
+        self.sections.pop(sector, None)
+        self.counts.pop(sector, None)
+
+    def _overlaps(self, low, high):
+        # Yields (sector, section slices, box slices) for every section the
+        # box from `low` to `high` overlaps.
+        first = sectorize(low)
+        last = sectorize([n - 1 for n in high])
+        for sx in range(first[0], last[0] + 1):
+            for sy in range(first[1], last[1] + 1):
+                for sz in range(first[2], last[2] + 1):
+                    section, box = [], []
+                    for n, s in enumerate((sx, sy, sz)):
+                        start = max(low[n], s * SECTOR_SIZE)
+                        stop = min(high[n], (s + 1) * SECTOR_SIZE)
+                        section.append(slice(start - s * SECTOR_SIZE,
+                                             stop - s * SECTOR_SIZE))
+                        box.append(slice(start - low[n], stop - low[n]))
+                    yield (sx, sy, sz), tuple(section), tuple(box)
+
+    def get_box(self, low, high):
+        """ Returns a new array with the block ids from `low` (inclusive) to
+        `high` (exclusive).
+        """
+        ids = numpy.zeros([b - a for a, b in zip(low, high)], numpy.uint16)
+        for sector, section, box in self._overlaps(low, high):
+            blocks = self.sections.get(sector)
+            if blocks is not None:
+                ids[box] = blocks[section]
+        return ids
+
+    def set_box(self, low, ids):
+        """ Writes the array of block `ids` into the world with its lowest
+        corner at `low`.
+        """
+        high = [a + n for a, n in zip(low, ids.shape)]
+        for sector, section, box in self._overlaps(low, high):
+            blocks = self.sections.get(sector)
+            if blocks is None:
+                if not ids[box].any():
+                    continue
+                blocks = self.sections[sector] = numpy.zeros(
+                    (SECTOR_SIZE,) * 3, numpy.uint16)
+            blocks[section] = ids[box]
+            self.counts[sector] = int(numpy.count_nonzero(blocks))
+            if not self.counts[sector]:
+                self.unload(sector)
+
+    def nbytes(self):
+        """ Returns the memory used by the block arrays. """
+        return sum(blocks.nbytes for blocks in self.sections.values())
@@ -1,12 +1,35 @@
+import array
+import functools
 import math
-import random
+
+import numpy
+
+# A little above the largest magnitude Perlin noise reaches, so that any
+# noise-driven offset scaled by it is a safe bound.
+NOISE_BOUND = 1.1
+
+@functools.lru_cache(maxsize=16)
+def permutation(seed,m=65535):
+    """ Returns the permutation table for `seed`: a shuffle of range(m),
+    repeated twice, as an array of uint16. Tables are cached, so generators
+    sharing a seed share one table and only the first pays for it.
+    """
+    p = numpy.random.default_rng(seed).permutation(m).astype(numpy.uint16)
+    return array.array('H',numpy.concatenate((p,p)).tobytes())
 
 class Perlin:
     def __call__(self,x,y): return math.floor(abs((self.noise(x*self.f,y*self.f)+1)/2)*40)
     def __init__(self,seed=None):
-        self.f = 15/512; self.m = 65535; p = list(range(self.m))
-        if seed: random.seed(seed)
-        random.shuffle(p); self.p = p+p
+        if seed is None: seed = numpy.random.SeedSequence().entropy
+        self.seed = seed; self.f = 15/512; self.m = 65535
+        # The scalar path indexes the array directly; the batch path views
+        # the same memory through NumPy.
+        self.p = permutation(seed,self.m)
+        self.table = numpy.frombuffer(self.p,numpy.uint16)
+
+    # Pickles as its seed; the table is rebuilt, or found in the cache, on
+    # the other side.
+    def __reduce__(self): return Perlin,(self.seed,)
 
     def fade(self,t): return t*t*t*(t*(t*6-15)+10)
     def lerp(self,t,a,b): return a+t*(b-a)
@@ -26,6 +49,235 @@ class Perlin:
         return lerp(w,lerp(v,lerp(u,grad(p[AA],x,y,z),grad(p[BA],x-1,y,z)),lerp(u,grad(p[AB],x,y-1,z),grad(p[BB],x-1,y-1,z))),
                       lerp(v,lerp(u,grad(p[AA+1],x,y,z-1),grad(p[BA+1],x-1,y,z-1)),lerp(u,grad(p[AB+1],x,y-1,z-1),grad(p[BB+1],x-1,y-1,z-1))))
 
+    def heights(self,x,y):
+        """ `__call__` over arrays of coordinates. Returns an int array of
+        the broadcast shape of `x` and `y`.
+        """
+        n = self.noise_many(numpy.asarray(x)*self.f,numpy.asarray(y)*self.f)
+        return numpy.floor(numpy.abs((n+1)/2)*40).astype(numpy.int64)
+
+    def heightmap(self,x,y,size=16):
+        """ Returns the heights of the size x size columns from (x, y),
+        indexed [x, y].
+        """
+        xs = numpy.arange(x,x+size)[:,None]; ys = numpy.arange(y,y+size)[None,:]
+        return self.heights(xs,ys)
+
+    def grad_many(self,hash,x,y,z):
+        h = hash&15; u = numpy.where(h&8,y,x)
+        v = numpy.where(h&12,numpy.where((h==12)|(h==14),x,z),y)
+        return numpy.where(h&1,u,-u)+numpy.where(h&2,v,-v)
+
+    def noise_many(self,x,y,z=0):
+        """ `noise` over arrays of coordinates, doing the same float
+        operations in the same order so every value matches the scalar
+        version exactly.
+        """
+        p,fade,lerp,grad = self.table,self.fade,self.lerp,self.grad_many
+        x,y,z = numpy.broadcast_arrays(*(numpy.asarray(n,numpy.float64) for n in (x,y,z)))
+        xf,yf,zf = numpy.floor(x),numpy.floor(y),numpy.floor(z)
+        X,Y,Z = (n.astype(numpy.int64)%self.m for n in (xf,yf,zf))
+        x=x-xf; y=y-yf; z=z-zf
+        u,v,w = fade(x),fade(y),fade(z)
+        A = p[X  ]+Y; AA = p[A]+Z; AB = p[A+1]+Z
+        B = p[X+1]+Y; BA = p[B]+Z; BB = p[B+1]+Z
+        return lerp(w,lerp(v,lerp(u,grad(p[AA],x,y,z),grad(p[BA],x-1,y,z)),lerp(u,grad(p[AB],x,y-1,z),grad(p[BB],x-1,y-1,z))),
+                      lerp(v,lerp(u,grad(p[AA+1],x,y,z-1),grad(p[BA+1],x-1,y,z-1)),lerp(u,grad(p[AB+1],x,y-1,z-1),grad(p[BB+1],x-1,y-1,z-1))))
+
+
+
+class Terrain:
+    """ Fractal heightmap terrain built from Perlin noise.
+    Parameters
+    ----------
+    seed : int or None
+        Seed of the height noise; the temperature noise uses `seed` + 1.
+    octaves : int
+        Number of noise layers summed into the height.
+    lacunarity : float
+        Factor by which the frequency grows from one octave to the next.
+    persistence : float
+        Factor by which the amplitude shrinks from one octave to the next.
+    frequency : float
+        Frequency of the first octave, in cycles per block.
+    height : int
+        Heights range from 0 to below `height`.
+    climate : float
+        Frequency of the temperature layer. Warm areas are flat plains and
+        cold areas use the full height range.
+    flatness : float
+        Fraction of the height range the warmest plains keep.
+    surface, fill : int
+        Block ids of the top block of each column and of the ones below it.
+    caves : bool
+        Whether to generate from a 3D density field instead of a pure
+        heightfield, which gives overhangs and caves. The cave noise uses
+        `seed` + 2.
+    overhang : float
+        How many blocks 3D noise can move the surface up or down by.
+    detail : float
+        Frequency of the overhang and cave noise.
+    cave_width : float
+        Caves are carved where the cave noise is within this of zero.
+    cave_floor : int
+        No caves are carved below this height.
+    """
+    def __init__(self,seed=None,octaves=4,lacunarity=2.0,persistence=0.5,
+                 frequency=15/512,height=40,climate=1/512,flatness=0.25,
+                 surface=1,fill=2,caves=False,overhang=6,detail=1/24,
+                 cave_width=0.08,cave_floor=1):
+        self.perlin = Perlin(seed); self.seed = self.perlin.seed
+        self.temperature_noise = Perlin(self.seed+1)
+        self.cave_noise = Perlin(self.seed+2)
+        self.caves = caves; self.overhang = overhang; self.detail = detail
+        self.cave_width = cave_width; self.cave_floor = cave_floor
+        self.octaves = octaves; self.lacunarity = lacunarity
+        self.persistence = persistence; self.frequency = frequency
+        self.height = height; self.climate = climate; self.flatness = flatness
+        self.surface = surface; self.fill = fill
+        scale = numpy.arange(octaves)
+        # Every octave gets its own offset so the octaves' lattices, which
+        # all share a corner at the origin, do not line up there.
+        self.scales = (frequency*lacunarity**scale)[:,None,None]
+        self.amplitudes = (persistence**scale)[:,None,None]
+        self.offsets = (scale*101.3)[:,None,None]
+
+    def fractal(self,x,z):
+        """ Returns the octaves summed at arrays of coordinates, scaled to
+        the spread of a single octave. All octaves are evaluated in one
+        batch.
+        """
+        x,z = numpy.broadcast_arrays(numpy.asarray(x,numpy.float64),numpy.asarray(z,numpy.float64))
+        n = self.perlin.noise_many(x*self.scales+self.offsets,z*self.scales+self.offsets)
+        return (n*self.amplitudes).sum(axis=0)/numpy.sqrt((self.amplitudes**2).sum())
+
+    def temperature(self,x,z):
+        """ Returns the temperature, 0 (cold) to 1 (warm), at arrays of
+        coordinates.
+        """
+        x,z = numpy.asarray(x)*self.climate,numpy.asarray(z)*self.climate
+        return numpy.clip(self.temperature_noise.noise_many(x,z)+0.5,0,1)
+
+    def heights(self,x,z):
+        """ Returns the int height of the top block at arrays of coordinates. """
+        relief = self.height*(1-(1-self.flatness)*self.temperature(x,z))
+        h = (self.fractal(x,z)+1)/2*relief+(self.height-relief)/2
+        return numpy.clip(numpy.floor(h),0,self.height-1).astype(numpy.int64)
+
+    def heightmap(self,x,z,size=16):
+        """ Returns the heights of the size x size columns from (x, z),
+        indexed [x, z].
+        """
+        return self.heights(numpy.arange(x,x+size)[:,None],numpy.arange(z,z+size)[None,:])
+
+    def blocks(self,heights):
+        """ Returns the uint16 block ids, indexed [x, y, z] from y = 0, of
+        columns with the given heightmap.
+        """
+        heights = heights[:,None,:]
+        y = numpy.arange(heights.max()+1)[None,:,None]
+        ids = numpy.where(y < heights,self.fill,0).astype(numpy.uint16)
+        ids[y == heights] = self.surface
+        return ids
+
+    def section(self,sector,heights,out=None):
+        """ Evaluates the density field over the section `sector` and writes
+        its block ids into `out`, an array of shape (size, size, size)
+        holding air, where size is that of `heights`, the heightmap of the
+        section's column. The noise moves the surface by less than
+        `overhang` * NOISE_BOUND blocks, so it is only evaluated for blocks
+        within that distance of their column's height. Blocks further below
+        are solid and blocks further above are air, so a section wholly
+        below or above that band skips the density noise. The cave noise is
+        only evaluated for solid blocks.
+        Returns `out` (a new array if None was given), or None if the
+        section is all air.
+        """
+        size = len(heights)
+        x0,y0,z0 = (n*size for n in sector)
+        reach = self.overhang*NOISE_BOUND
+        if y0 > heights.max()+reach: return None
+        if out is None: out = numpy.zeros((size,)*3,numpy.uint16)
+        d = self.detail
+        # One layer past the top, to find the blocks with air above them.
+        depth = heights[:,None,:]-numpy.arange(y0,y0+size+1)[None,:,None]
+        solid = depth >= reach
+        near = numpy.nonzero(numpy.abs(depth) < reach)
+        if len(near[0]):
+            x,y,z = near[0]+x0,near[1]+y0,near[2]+z0
+            solid[near] = depth[near]+self.overhang*self.perlin.noise_many(x*d,y*d,z*d) >= 0
+        ids = numpy.where(solid[:,1:],self.fill,self.surface)
+        ids[~solid[:,:-1]] = 0
+        # Caves are carved out of the solid blocks from the floor up.
+        floor = max(self.cave_floor-y0,0)
+        carve = numpy.nonzero(ids[:,floor:])
+        if len(carve[0]):
+            x,y,z = carve[0]+x0,carve[1]+y0+floor,carve[2]+z0
+            cave = numpy.abs(self.cave_noise.noise_many(x*d,y*d,z*d)) < self.cave_width
+            ids[:,floor:][tuple(n[cave] for n in carve)] = 0
+        out[...] = ids
+        return out
+
+    def generate(self,column,size=16):
+        """ Generates the size x size sector column `column`, given as (x, z)
+        in sections. Returns its heightmap as uint16 and its block ids,
+        indexed [x, y, z] from y = 0. The result depends only on the
+        settings and `column`.
+        """
+        heights = self.heightmap(column[0]*size,column[1]*size,size)
+        if not self.caves:
+            return heights.astype(numpy.uint16),self.blocks(heights)
+        top = heights.max()+self.overhang*NOISE_BOUND
+        ids = numpy.zeros((size,(int(top)//size+1)*size,size),numpy.uint16)
+        for sy in range(ids.shape[1]//size):
+            # Each section is written in place into its slice of the column.
+            self.section((column[0],sy,column[1]),heights,ids[:,sy*size:(sy+1)*size])
+        return heights.astype(numpy.uint16),ids
+
+
+def ring(center,r):
+    """ Returns the sector columns on the square ring `r` columns out from
+    `center`, going round it once.
+    """
+    x,z = center
+    if not r: return [(x,z)]
+    return ([(x+i,z-r) for i in range(-r,r)]+[(x+r,z+i) for i in range(-r,r)]+
+            [(x-i,z+r) for i in range(-r,r)]+[(x-r,z-i) for i in range(-r,r)])
+
+def spiral(center=(0,0),radius=None):
+    """ Yields sector columns ring by ring outward from `center`, out to
+    `radius` rings, or forever without one. Sending a new centre into the
+    generator restarts the spiral around it, skipping the columns already
+    yielded; the send returns the next column.
+    """
+    seen = set(); r = 0
+    while radius is None or r <= radius:
+        for column in ring(center,r):
+            if column in seen: continue
+            seen.add(column)
+            new = yield column
+            if new is not None: center = new; r = -1; break
+        r += 1
+
+def stream(terrain,center=(0,0),radius=None,size=16,cache=None):
+    """ Generates the sector columns of `terrain` lazily in `spiral`
+    order, yielding (column, heights, ids) as from `Terrain.generate`. A
+    new centre can be sent in the same way. With a `cache.ChunkCache`,
+    columns are looked up there first and stored there after. As each
+    column is yielded once, this suits one pass over an area, such as an
+    export, rather than a view that unloads and reloads columns.
+    """
+    columns = spiral(center,radius); new = None
+    while True:
+        try: column = next(columns) if new is None else columns.send(new)
+        except StopIteration: return
+        key = (terrain.seed,column)
+        arrays = cache.get(key) if cache is not None else None
+        if arrays is None:
+            arrays = terrain.generate(column,size)
+            if cache is not None: cache.put(key,*arrays)
+        new = yield (column,)+tuple(arrays)
+
 
 
 